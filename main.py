@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 
+import asyncio
+import atexit
+import bisect
+import heapq
+import itertools
 import json
+import mmap
 import os
 import random
+import re
+import sys
+import threading
 import time
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
@@ -19,16 +28,120 @@ from rich.text import Text
 from rich.tree import Tree
 from candlestick_chart import Candle, Chart
 import yfinance as yf
-import mplfinance as mpf
-import matplotlib.pyplot as plt
+import pandas as pd
+import numpy as np
 import tempfile
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
 console = Console()
 
+# Write-behind state: {file: data} waiting to be flushed by the writer thread
+_dirty = {}
+_dirty_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_dirty_event = threading.Event()
+_writer_thread = None
+
+# In-process caches: {(symbol, period): (timestamp, result)} and {symbol: yf.Ticker}
+_price_cache = {}
+_ticker_cache = {}
+
+# Number of events currently in ORDERS_LOG and USERS_LOG, used to decide when to compact them
+_order_log_events = 0
+_user_log_events = 0
+
+# Order id sequence, seeded from the clock in milliseconds so ids stay unique across restarts
+_order_seq = itertools.count(time.time_ns() // 1_000_000)
+
+# Pending order ids per user and symbol, insertion-ordered: {username: {symbol: {order_id: None}}}
+_orders_by_user = {}
+
+# Limit-order target prices per symbol and side, kept sorted so a quote finds the orders it
+# fills by bisecting: {symbol: {'buy' | 'sell': ([price, ...], [order_id, ...])}}
+_order_triggers = {}
+
+# Display form of stop-loss set times: {iso timestamp: "MM/DD HH:MM"}
+_set_time_labels = {}
+
+# Latest SMA levels: {(symbol, period, windows): (history frame they were computed from, {window: value})}
+_sma_cache = {}
+
+# Net worth cache: {id(user): (stocks snapshot, stocks length, balance, net worth)}
+_net_worth_cache = {}
+
+# Leaderboard entries shown by 'leaderboard', best first: [(trader, score)]; None means rebuild
+_leaderboard_top = None
+
+# Reused UI renderable: the loading progress bar
+_loading_progress = Progress(
+    SpinnerColumn("dots"),
+    TextColumn("[progress.description]{task.description}"),
+    BarColumn(bar_width=30),
+    TextColumn("[progress.percentage]{task.percentage:>3.1f}%"),
+    transient=True
+)
+
+# Static help panels, built on first use: {name: Panel}
+_help_panels = {}
+
+# mplfinance module and chart style, imported on the first 'graph ... png' since
+# matplotlib adds about half a second to startup
+_chart_backend = None
+_chart_backend_lock = threading.Lock()
+# pyplot's figure manager is not thread-safe, so background renders take turns
+_chart_render_lock = threading.Lock()
+
+# On-disk history cache; a copy written after the last NSE close (15:30 IST) stays fresh
+# until the next open, otherwise it expires like the in-memory history cache
+CACHE_DIR = '.cache'
+IST = timezone(timedelta(hours=5, minutes=30))
+NSE_OPEN_TIME = (9, 15)
+NSE_CLOSE_TIME = (15, 30)
+# Only symbols and yfinance periods matching these are cached, since both become part of the file name
+CACHE_SYMBOL_RE = re.compile(r'[A-Z0-9.&-]+')
+HISTORY_PERIODS = frozenset(('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max'))
+
+# Risk profiles as (label, position size) with matching (stop loss, take profit) price multipliers
+RISK_PROFILES = (
+    ("🟢 Conservative", "25% of portfolio"),  # 5% stop loss, 10% take profit
+    ("🟡 Moderate", "15% of portfolio"),      # 8% stop loss, 15% take profit
+    ("🔴 Aggressive", "10% of portfolio"),    # 12% stop loss, 25% take profit
+)
+RISK_MULTIPLIERS = np.array([[0.95, 1.10], [0.92, 1.15], [0.88, 1.25]])
+
+# Commands whose first argument is a stock symbol
+SYMBOL_COMMANDS = frozenset(('prices', 'details', 'graph', 'buy', 'limitbuy', 'sell', 'limitsell',
+                             'sellpct', 'sellanalysis', 'stoploss', 'trailstop'))
+
+# Commands that change the current user's account, another user's account
+# (named by the first argument), or the leaderboard, and so need a save
+USER_DATA_COMMANDS = frozenset(('buy', 'sell', 'sellpct', 'stoploss', 'trailstop', 'cancel'))
+TARGET_USER_COMMANDS = frozenset(('resetuser', 'deleteuser', 'setbalance'))
+LEADERBOARD_COMMANDS = frozenset(('leaderboard', 'deleteuser'))
+
+# Usernames with admin privileges
+_ADMIN_USERS = frozenset(('admin', 'administrator', 'root', 'superuser'))
+
 # Data files
-USERS_FILE = 'users.json'
+USERS_FILE = 'users.json'  # snapshot; changes since it was written are in USERS_LOG
+USERS_LOG = 'users.jsonl'
 LEADERBOARD_FILE = 'leaderboard.json'
-ORDERS_FILE = 'pending_orders.json'
+ORDERS_FILE = 'pending_orders.json'  # legacy snapshot, migrated into ORDERS_LOG on first load
+ORDERS_LOG = 'pending_orders.jsonl'
+
+# Number of traders shown on the leaderboard
+LEADERBOARD_SIZE = 10
+
+# Rewrite an append-only log once it holds this many times more events than live entries
+LOG_COMPACT_RATIO = 2
+LOG_COMPACT_MIN_EVENTS = 64
+
+# Seconds to coalesce data-file writes before flushing them to disk
+SAVE_DEBOUNCE_SECONDS = 0.5
 
 # NIFTY 50 symbols for tracking top performers
 SYMBOLS = [
@@ -44,9 +157,42 @@ SYMBOLS = [
     'TITAN.NS', 'TRENT.NS', 'ULTRACEMCO.NS', 'UPL.NS', 'WIPRO.NS'
 ]
 
+# Yahoo tickers and bare NSE symbols as parallel interned tuples, indexed by position
+SYMBOLS_FULL = tuple(sys.intern(s) for s in SYMBOLS)
+SYMBOLS_BARE = tuple(sys.intern(s[:-3]) for s in SYMBOLS)
+SYM_INDEX = {b: i for i, b in enumerate(SYMBOLS_BARE)}
+BARE_BY_FULL = dict(zip(SYMBOLS_FULL, SYMBOLS_BARE))
+
+# Yahoo caps multi-ticker quote requests at roughly 20 symbols per URL
+PRICE_BATCH_SIZE = 20
+
+# Seconds before cached quotes / historical data are fetched again
+QUOTE_CACHE_TTL = 30
+PRICE_POLL_SECONDS = 60  # background price refresh while waiting at the prompt
+HISTORY_CACHE_TTL = 3600
+# Seconds to remember that a symbol had no quote before asking Yahoo again
+MISSING_QUOTE_TTL = 60
+
+# Moving-average windows shown on the technical analysis chart
+SMA_WINDOWS = (5, 20, 50, 200)
+
+# Pre-bound formatters for table cells rendered in bulk
+PRICE_FMT = "₹{:,.2f}".format
+PCT_FMT = "{:+.2f}%".format
+GAIN_PCT_FMT = "[bright_green]{:+.2f}%[/bright_green]".format
+LOSS_PCT_FMT = "[bright_red]{:+.2f}%[/bright_red]".format
+UNIT_PRICE_FMT = "₹{:.2f}".format
+# (P/L amount, P/L percent) formatters, picked once per row by the sign of the P/L
+GAIN_PL_FMTS = ("[bright_green]{:+,.2f}[/bright_green]".format, "[bright_green]{:+.1f}%[/bright_green]".format)
+LOSS_PL_FMTS = ("[bright_red]{:+,.2f}[/bright_red]".format, "[bright_red]{:+.1f}%[/bright_red]".format)
+FLAT_PL_FMTS = ("[white]{:+,.2f}[/white]".format, "[white]{:+.1f}%[/white]".format)
+GAIN_CASH_FMT = "[bright_green]₹{:+,.2f}[/bright_green]".format
+LOSS_CASH_FMT = "[bright_red]₹{:+,.2f}[/bright_red]".format
+FLAT_CASH_FMT = "[white]₹{:+,.2f}[/white]".format
+
 # For challenge mode (mock data)
 INITIAL_STOCKS = [
-    {'symbol': s[:-3], 'price': 150.0, 'vol': 0.02, 'last_price': 150.0} for s in SYMBOLS[:10]
+    {'symbol': s, 'price': 150.0, 'vol': 0.02, 'last_price': 150.0} for s in SYMBOLS_BARE[:10]
 ]
 
 EVENTS = [
@@ -68,124 +214,648 @@ ASCII_LOGO = """
 ✨ Stop-Loss • Limit Orders • Professional Charts • Admin Tools ✨
 """
 
+# Quick start tips shown under the help menu
+QUICK_START_TIPS = """
+💡 [bold]Quick Start Tips:[/bold]
+• Type [green]prices[/green] to see current market prices
+• Use [green]buy RELIANCE 10[/green] to buy 10 shares of RELIANCE
+• Set protection with [yellow]stoploss RELIANCE 10 2500[/yellow]
+• View your holdings with [magenta]portfolio[/magenta]
+• Check top performers with [cyan]top10[/cyan]
+• Get help anytime with [cyan]help[/cyan]
+    """
+ADMIN_TIP = "\n🔧 [bold red]Admin Mode Active![/bold red] Use admin commands above for system management."
+
+def json_loads(raw):
+    return orjson.loads(raw) if orjson else json.loads(bytes(raw))
+
+def json_dumps(data, indent=True):
+    """Serialize data to JSON bytes, indented for readability unless indent is False"""
+    if orjson:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    # The C encoder (used without indent) snapshots data while holding the GIL, so it
+    # is safe from the writer thread; indent only that private copy
+    raw = json.dumps(data, separators=(',', ':'))
+    if indent:
+        raw = json.dumps(json.loads(raw), indent=2)
+    return raw.encode('utf-8')
+
+def read_json_mapped(file):
+    """Parse a JSON file directly from a read-only memory map of it"""
+    fd = os.open(file, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        if os.fstat(fd).st_size == 0:
+            return json_loads(b'')
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        try:
+            with memoryview(mm) as view:
+                return json_loads(view)
+        finally:
+            mm.close()
+    finally:
+        os.close(fd)
+
 def load_data(file, default):
     if os.path.exists(file):
         try:
-            with open(file, 'r') as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    if file == LEADERBOARD_FILE:
-                        for user, score in list(data.items()):
-                            if not isinstance(score, (int, float)):
-                                console.print(f"[red]Invalid score for {user} in {file}. Resetting to 0.0.[/red]")
-                                data[user] = 0.0
-                    elif file == USERS_FILE:
-                        for user, info in list(data.items()):
-                            if not isinstance(info, dict) or 'balance' not in info or 'portfolio' not in info:
-                                console.print(f"[red]Invalid data for {user} in {file}. Resetting.[/red]")
-                                data[user] = {'balance': 10000.0, 'portfolio': {}, 'stop_losses': {}}
-                            if 'stop_losses' not in info:
-                                data[user]['stop_losses'] = {}
-                return data
+            data = read_json_mapped(file)
+            if isinstance(data, dict):
+                if file == LEADERBOARD_FILE:
+                    for user, score in list(data.items()):
+                        if not isinstance(score, (int, float)):
+                            console.print(f"[red]Invalid score for {user} in {file}. Resetting to 0.0.[/red]")
+                            data[user] = 0.0
+                elif file == USERS_FILE:
+                    for user, info in list(data.items()):
+                        if not isinstance(info, dict) or 'balance' not in info or 'portfolio' not in info:
+                            console.print(f"[red]Invalid data for {user} in {file}. Resetting.[/red]")
+                            data[user] = {'balance': 10000.0, 'portfolio': {}, 'stop_losses': {}}
+                        if 'stop_losses' not in info:
+                            data[user]['stop_losses'] = {}
+                        # Guarantee the position keys so readers can index them directly
+                        for position in data[user]['portfolio'].values():
+                            position.setdefault('shares', 0)
+                            position.setdefault('avg_cost', 0.0)
+                        intern_symbols(data[user])
+            return data
         except json.JSONDecodeError:
             console.print(f"[red]Error loading {file}. Creating new data.[/red]")
             return default
     return default
 
+def intern_symbols(info):
+    """Re-key a user's holdings and stops by interned symbols, matching the interned command arguments"""
+    for field in ('portfolio', 'stop_losses'):
+        info[field] = {sys.intern(sym): value for sym, value in info[field].items()}
+    return info
+
 def save_data(file, data):
+    # Write to a temp file and swap it in so a crash never leaves a partial file
+    tmp_file = f"{file}.tmp"
     try:
-        with open(file, 'w') as f:
-            json.dump(data, f, indent=2)
+        with open(tmp_file, 'wb') as f:
+            f.write(json_dumps(data))
+        os.replace(tmp_file, file)
+        return True
     except PermissionError:
         console.print(f"[red]Permission denied while saving {file}. Check file permissions.[/red]")
     except Exception as e:
         console.print(f"[red]Error saving {file}: {e}[/red]")
+    return False
+
+def mark_dirty(file, data):
+    """Queue data for writing; writes within the debounce window are coalesced"""
+    global _writer_thread
+    with _dirty_lock:
+        _dirty[file] = data
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=write_behind_loop, name="data-writer", daemon=True)
+            _writer_thread.start()
+    _dirty_event.set()
+
+def write_behind_loop():
+    """Writer thread: wait for queued data, let further changes coalesce, then flush"""
+    while True:
+        _dirty_event.wait()
+        time.sleep(SAVE_DEBOUNCE_SECONDS)
+        _dirty_event.clear()
+        flush_data()
+
+def flush_data():
+    """Write all queued data files to disk"""
+    with _flush_lock:
+        with _dirty_lock:
+            pending = list(_dirty.items())
+            _dirty.clear()
+        for file, data in pending:
+            save_data(file, data)
+
+atexit.register(flush_data)
+
+def append_log(file, events):
+    """Append events to a JSON-lines log without rewriting what is already there"""
+    data = b''.join(json_dumps(event, indent=False) + b'\n' for event in events)
+    try:
+        with open(file, 'a+b') as f:
+            # Finish a line torn by a crash mid-append so the new event is not glued onto it
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    data = b'\n' + data
+            f.write(data)
+    except PermissionError:
+        console.print(f"[red]Permission denied while saving {file}. Check file permissions.[/red]")
+    except Exception as e:
+        console.print(f"[red]Error saving {file}: {e}[/red]")
+
+def read_log(file):
+    """Return the events in a JSON-lines log, skipping lines that fail to parse"""
+    events = []
+    with open(file, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json_loads(line))
+            except json.JSONDecodeError:
+                # A crash mid-append can leave a torn final line behind
+                console.print(f"[yellow]Skipping unreadable entry in {file}.[/yellow]")
+    return events
+
+def rewrite_log(file, events):
+    """Replace a log with the given events, swapping it in atomically"""
+    tmp_file = f"{file}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(b''.join(json_dumps(event, indent=False) + b'\n' for event in events))
+        os.replace(tmp_file, file)
+    except Exception as e:
+        console.print(f"[red]Error compacting {file}: {e}[/red]")
+
+def log_order(op, order_id=None, order=None, ids=None):
+    """Record a pending-order change ('add', 'remove' or 'clear') in the order log"""
+    global _order_log_events
+    event = {'op': op}
+    if order_id is not None:
+        event['id'] = order_id
+    if ids is not None:
+        event['ids'] = ids
+    if order is not None:
+        event['data'] = order
+    append_log(ORDERS_LOG, [event])
+    _order_log_events += 1
+
+def log_user(users, username):
+    """Record a user's current account, or its deletion, in the user log"""
+    global _user_log_events
+    info = users.get(username)
+    if info is None:
+        event = {'op': 'delete', 'user': username}
+    else:
+        event = {'op': 'set', 'user': username, 'data': info}
+    append_log(USERS_LOG, [event])
+    _user_log_events += 1
+
+def load_users():
+    """Load the users snapshot and replay the account changes logged since it was written"""
+    global _user_log_events
+    users = load_data(USERS_FILE, {})
+    if os.path.exists(USERS_LOG):
+        events = read_log(USERS_LOG)
+        for event in events:
+            op = event.get('op')
+            if op == 'set':
+                users[event['user']] = intern_symbols(event['data'])
+            elif op == 'delete':
+                users.pop(event['user'], None)
+        _user_log_events = len(events)
+    return users
+
+def compact_users(users):
+    """Write a full users snapshot and start a fresh user log"""
+    global _user_log_events
+    # Only drop the log once the snapshot that replaces it is safely on disk
+    if save_data(USERS_FILE, users):
+        rewrite_log(USERS_LOG, [])
+        _user_log_events = 0
+
+def maybe_compact_users(users):
+    """Snapshot the users once the log has grown well past the number of accounts"""
+    if _user_log_events > max(LOG_COMPACT_MIN_EVENTS, LOG_COMPACT_RATIO * len(users)):
+        compact_users(users)
+
+def load_orders():
+    """Rebuild pending orders by replaying the order log, migrating the legacy JSON file if needed"""
+    global _order_log_events
+    if not os.path.exists(ORDERS_LOG):
+        pending_orders = load_data(ORDERS_FILE, {})
+        compact_orders(pending_orders)
+        index_orders(pending_orders)
+        return pending_orders
+    pending_orders = {}
+    events = read_log(ORDERS_LOG)
+    for event in events:
+        op = event.get('op')
+        if op == 'add':
+            pending_orders[event['id']] = event['data']
+        elif op == 'remove':
+            for order_id in event.get('ids') or (event['id'],):
+                pending_orders.pop(order_id, None)
+        elif op == 'clear':
+            pending_orders.clear()
+    _order_log_events = len(events)
+    index_orders(pending_orders)
+    return pending_orders
+
+def index_orders(pending_orders):
+    """Rebuild the per-user and trigger-price order indexes from the pending orders"""
+    _orders_by_user.clear()
+    _order_triggers.clear()
+    for order_id, order in pending_orders.items():
+        order['symbol'] = sys.intern(order['symbol'])
+        index_order(order_id, order)
+
+def index_order(order_id, order):
+    _orders_by_user.setdefault(order['user'], {}).setdefault(order['symbol'], {})[order_id] = None
+    if order.get('type') in ('buy', 'sell'):
+        prices, ids = _order_triggers.setdefault(order['symbol'], {}).setdefault(order['type'], ([], []))
+        i = bisect.bisect_right(prices, order['price'])
+        prices.insert(i, order['price'])
+        ids.insert(i, order_id)
+
+def unindex_trigger(order_id, order):
+    sides = _order_triggers.get(order['symbol'])
+    side = sides.get(order.get('type')) if sides else None
+    if side is None:
+        return
+    prices, ids = side
+    # Step past other orders at the same price to find this one
+    i = bisect.bisect_left(prices, order['price'])
+    while i < len(ids) and ids[i] != order_id:
+        i += 1
+    if i < len(ids):
+        del prices[i]
+        del ids[i]
+    if not ids:
+        del sides[order['type']]
+        if not sides:
+            del _order_triggers[order['symbol']]
+
+def unindex_order(order_id, order):
+    unindex_trigger(order_id, order)
+    by_symbol = _orders_by_user.get(order['user'])
+    if by_symbol is None:
+        return
+    ids = by_symbol.get(order['symbol'])
+    if ids is not None:
+        ids.pop(order_id, None)
+        if not ids:
+            del by_symbol[order['symbol']]
+    if not by_symbol:
+        del _orders_by_user[order['user']]
+
+def user_order_ids(username, symbol=None):
+    """Return the ids of a user's pending orders, optionally for one symbol, in placement order per symbol"""
+    by_symbol = _orders_by_user.get(username)
+    if not by_symbol:
+        return []
+    if symbol is not None:
+        return list(by_symbol.get(symbol, ()))
+    return [order_id for ids in by_symbol.values() for order_id in ids]
+
+def add_order(pending_orders, order_id, order):
+    pending_orders[order_id] = order
+    index_order(order_id, order)
+    log_order('add', order_id, order)
+
+def remove_orders(pending_orders, order_ids):
+    """Remove several orders, recording them as a single log event"""
+    if not order_ids:
+        return
+    for order_id in order_ids:
+        unindex_order(order_id, pending_orders.pop(order_id))
+    log_order('remove', ids=list(order_ids))
+
+def clear_orders(pending_orders):
+    pending_orders.clear()
+    _orders_by_user.clear()
+    _order_triggers.clear()
+    log_order('clear')
+
+def compact_orders(pending_orders):
+    """Rewrite the order log as one 'add' event per live order"""
+    global _order_log_events
+    rewrite_log(ORDERS_LOG, [{'op': 'add', 'id': order_id, 'data': order}
+                             for order_id, order in pending_orders.items()])
+    _order_log_events = len(pending_orders)
+
+def maybe_compact_orders(pending_orders):
+    """Compact the order log once it has grown well past the live order count"""
+    if _order_log_events > max(LOG_COMPACT_MIN_EVENTS, LOG_COMPACT_RATIO * len(pending_orders)):
+        compact_orders(pending_orders)
 
 def enhanced_loading_animation(message, duration=1.0):
     """Enhanced loading animation with progress bar"""
-    progress = Progress(
-        SpinnerColumn("dots"),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(bar_width=30),
-        TextColumn("[progress.percentage]{task.percentage:>3.1f}%"),
-        transient=True
-    )
-    task = progress.add_task(description=message, total=100)
-    with Live(progress, console=console, refresh_per_second=20):
+    task = _loading_progress.add_task(description=message, total=100)
+    with Live(_loading_progress, console=console, refresh_per_second=20):
         for i in range(100):
             time.sleep(duration/100)
-            progress.update(task, advance=1)
+            _loading_progress.update(task, advance=1)
+    _loading_progress.remove_task(task)
+
+# Table builders; tables are built fresh per render because emptying one for reuse
+# would mean clearing Rich's private column cells
+def build_status_table():
+    status_table = Table.grid(padding=1)
+    status_table.add_column(style="cyan", justify="right")
+    status_table.add_column(style="white")
+    return status_table
+
+def build_movers_table(title, style):
+    table = Table(title=title, style=style, expand=True)
+    table.add_column("Symbol", style="cyan")
+    table.add_column("Price", justify="right", style="white")
+    table.add_column("Change", justify="right")
+    return table
 
-def create_status_panel(user, stocks):
+def build_ranked_table(title, style, price_style):
+    table = Table(title=title, style=style, expand=True)
+    table.add_column("Rank", style="cyan", width=5)
+    table.add_column("Symbol", style="white", width=10)
+    table.add_column("Price", justify="right", style=price_style, width=12)
+    table.add_column("Change", justify="right", width=10)
+    return table
+
+def build_leaderboard_table():
+    table = Table(title="🏆 Top Traders Leaderboard", style="bold magenta", expand=True)
+    table.add_column("Rank", style="yellow", width=6)
+    table.add_column("Trader", style="cyan", width=15)
+    table.add_column("Net Worth", justify="right", style="green", width=15)
+    table.add_column("Status", justify="center", width=10)
+    return table
+
+def build_sell_analysis_table():
+    table = Table(style="bold cyan")
+    table.add_column("Metric", style="white", width=20)
+    table.add_column("Value", style="green", width=15)
+    table.add_column("Assessment", style="yellow", width=25)
+    return table
+
+def create_status_panel(user, stocks_by_sym):
     """Create a beautiful status panel with user info"""
-    net_worth = calculate_net_worth(user, stocks)
+    net_worth = calculate_net_worth(user, stocks_by_sym)
     portfolio_value = net_worth - user['balance']
     
     # Status table
-    status_table = Table.grid(padding=1)
-    status_table.add_column(style="cyan", justify="right")
-    status_table.add_column(style="white")
+    status_table = build_status_table()
     
-    status_table.add_row("💰 Cash Balance:", f"₹{user['balance']:,.2f}")
-    status_table.add_row("📊 Portfolio Value:", f"₹{portfolio_value:,.2f}")
-    status_table.add_row("💎 Net Worth:", f"₹{net_worth:,.2f}")
+    status_table.add_row("💰 Cash Balance:", PRICE_FMT(user['balance']))
+    status_table.add_row("📊 Portfolio Value:", PRICE_FMT(portfolio_value))
+    status_table.add_row("💎 Net Worth:", PRICE_FMT(net_worth))
     status_table.add_row("📈 Active Holdings:", f"{len(user['portfolio'])} stocks")
-    status_table.add_row("🛡️  Stop Losses:", f"{len(user.get('stop_losses', {}))} orders")
+    status_table.add_row("🛡️  Stop Losses:", f"{len(user['stop_losses'])} orders")
     
     return Panel(status_table, title="💼 Account Status", border_style="green")
 
-def fetch_prices():
-    stocks = []
-    nse_stocks = SYMBOLS
-    for symbol in nse_stocks:
+def download_quotes(tickers):
+    """Fetch latest prices for Yahoo tickers using batched multi-ticker downloads"""
+    frames = []
+    for i in range(0, len(tickers), PRICE_BATCH_SIZE):
+        batch = list(tickers[i:i + PRICE_BATCH_SIZE])
         try:
-            ticker = yf.Ticker(symbol)
-            hist = ticker.history(period="1d")
-            if not hist.empty:
-                price = hist['Close'].iloc[-1]
-                prev_price = hist['Close'].iloc[-2] if len(hist) > 1 else price
-                change = ((price - prev_price) / prev_price) * 100 if prev_price != 0 else 0
-                stocks.append({'symbol': symbol.replace('.NS', ''), 'price': price, 'change': change})
+            frame = yf.download(batch, period="2d", group_by='ticker', threads=True,
+                                progress=False, auto_adjust=False)
+            if not frame.empty:
+                frames.append(frame)
         except Exception as e:
-            console.print(f"[yellow]Warning: Failed to fetch {symbol}: {str(e)}[/yellow]")
-            continue
-    return stocks if stocks else []
+            console.print(f"[yellow]Warning: Failed to fetch {', '.join(batch)}: {str(e)}[/yellow]")
+    if not frames:
+        return []
+
+    # One column of closes per ticker; tickers that failed to download are all-NaN
+    closes = pd.concat(frames, axis=1).xs('Close', axis=1, level=1).dropna(axis=1, how='all')
+    if closes.empty:
+        return []
+    closes = closes.ffill()
+    price = closes.iloc[-1]
+    prev_price = closes.iloc[-2].fillna(price) if len(closes) > 1 else price
+    change = ((price / prev_price - 1) * 100).where(prev_price != 0, 0)
+
+    return [
+        {'symbol': BARE_BY_FULL.get(symbol) or symbol[:-3], 'price': p, 'last_price': lp, 'change': c}
+        for symbol, p, lp, c in zip(closes.columns, price.to_numpy().tolist(),
+                                    prev_price.to_numpy().tolist(), change.to_numpy().tolist())
+    ]
+
+def fetch_prices():
+    """Fetch latest prices for all tracked symbols"""
+    return download_quotes(SYMBOLS_FULL)
+
+def fetch_prices_batch(symbols):
+    """Fetch quotes for several bare symbols in one download, reusing fresh cached quotes"""
+    quotes = {}
+    to_fetch = []
+    for sym in symbols:
+        cached = get_cached((sym, 'quote'), QUOTE_CACHE_TTL)
+        if cached:
+            quotes[sym] = cached
+        elif not get_cached((sym, 'missing'), MISSING_QUOTE_TTL):
+            to_fetch.append(sym)
+    if to_fetch:
+        for stock in download_quotes([to_ticker(sym) for sym in to_fetch]):
+            set_cached((stock['symbol'], 'quote'), stock)
+            quotes[stock['symbol']] = stock
+        for sym in to_fetch:
+            if sym not in quotes:
+                set_cached((sym, 'missing'), True)
+    return quotes
+
+def to_ticker(sym):
+    """Map a bare NSE symbol to its Yahoo ticker, reusing the precomputed string when known"""
+    i = SYM_INDEX.get(sym)
+    return SYMBOLS_FULL[i] if i is not None else f"{sym}.NS"
+
+def get_ticker(sym):
+    """Return a memoized yfinance Ticker so session setup happens once per symbol"""
+    ticker = _ticker_cache.get(sym)
+    if ticker is None:
+        ticker = _ticker_cache[sym] = yf.Ticker(to_ticker(sym))
+    return ticker
+
+def get_cached(key, ttl):
+    """Return a cached result if it is younger than ttl seconds, else None"""
+    entry = _price_cache.get(key)
+    if entry and time.monotonic() - entry[0] < ttl:
+        return entry[1]
+    return None
+
+def set_cached(key, result):
+    _price_cache[key] = (time.monotonic(), result)
 
 def fetch_single_price(sym):
+    cached = get_cached((sym, 'quote'), QUOTE_CACHE_TTL)
+    if cached:
+        return cached
+    if get_cached((sym, 'missing'), MISSING_QUOTE_TTL):
+        return None
     try:
-        ticker = yf.Ticker(f"{sym}.NS")
+        ticker = get_ticker(sym)
         data = ticker.history(period="2d", auto_adjust=False)
         if len(data) < 2:
+            set_cached((sym, 'missing'), True)
             return None
         prev_close = data['Close'].iloc[-2]
         current = data['Close'].iloc[-1]
         change = ((current - prev_close) / prev_close * 100) if prev_close != 0 else 0
-        return {
+        stock = {
             'symbol': sym,
             'price': current,
             'last_price': prev_close,
             'change': change
         }
+        set_cached((sym, 'quote'), stock)
+        return stock
     except Exception as e:
         console.print(f"[red]Error fetching {sym}: {e}[/red]")
+        set_cached((sym, 'missing'), True)
+        return None
+
+def get_price(sym, stocks_by_sym):
+    """Quote for sym from the stocks index, falling back to a (cached) single-symbol fetch"""
+    return stocks_by_sym.get(sym) or fetch_single_price(sym)
+
+def fast_info_value(fast_info, name):
+    """Read one field from a yfinance fast_info, returning None when Yahoo has no value for it"""
+    try:
+        value = fast_info[name]
+    except Exception:
         return None
+    return None if value is None or pd.isna(value) else value
+
+def index_stocks(stocks):
+    """Build a symbol -> stock dict for O(1) lookups into a stocks list"""
+    return {s['symbol']: s for s in stocks}
+
+def fetch_missing_prices(symbols, stocks_by_sym):
+    """Fetch prices in one batch for symbols missing from the pre-fetched stocks index"""
+    missing = [sym for sym in dict.fromkeys(symbols) if sym not in stocks_by_sym]
+    if not missing:
+        return {}
+    return fetch_prices_batch(missing)
+
+def last_market_close():
+    """Timestamp of the most recent weekday NSE close"""
+    now = datetime.now(IST)
+    close = now.replace(hour=NSE_CLOSE_TIME[0], minute=NSE_CLOSE_TIME[1], second=0, microsecond=0)
+    if now < close:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+    return close.timestamp()
+
+def market_is_open():
+    """Whether NSE is in its weekday trading session right now"""
+    now = datetime.now(IST)
+    return now.weekday() < 5 and NSE_OPEN_TIME <= (now.hour, now.minute) < NSE_CLOSE_TIME
+
+def history_cache_path(sym, period):
+    """Cache file for a symbol and period, or None if either is not safe to use in a file name"""
+    if not CACHE_SYMBOL_RE.fullmatch(sym) or period not in HISTORY_PERIODS:
+        return None
+    return os.path.join(CACHE_DIR, f"{sym}_{period}.json")
+
+def read_history_cache(sym, period):
+    """Load cached history from disk if no trading has happened since it was written"""
+    path = history_cache_path(sym, period)
+    if path is None:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+        closed_since = mtime >= last_market_close() and not market_is_open()
+        if not closed_since and time.time() - mtime >= HISTORY_CACHE_TTL:
+            return None
+        return pd.read_json(path, orient='table')
+    except Exception:
+        return None
+
+def write_history_cache(sym, period, data):
+    path = history_cache_path(sym, period)
+    if path is None:
+        return
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # The table orient keeps the dtypes and the timezone-aware index, and unlike a
+        # pickle the file cannot run code when it is loaded
+        data.to_json(tmp_path, orient='table')
+        os.replace(tmp_path, path)
+    except Exception as e:
+        console.print(f"[yellow]Warning: Could not cache history for {sym}: {e}[/yellow]")
 
 def fetch_historical_data(sym, period):
+    cached = get_cached((sym, period), HISTORY_CACHE_TTL)
+    if cached is not None:
+        return cached
+    data = read_history_cache(sym, period)
+    if data is not None:
+        set_cached((sym, period), data)
+        return data
     try:
-        ticker = yf.Ticker(f"{sym}.NS")
+        ticker = get_ticker(sym)
         data = ticker.history(period=period)
         if data.empty:
             raise Exception("No historical data available")
+        set_cached((sym, period), data)
+        write_history_cache(sym, period, data)
         return data
     except Exception as e:
         console.print(f"[red]Error fetching historical data for {sym}: {e}[/red]")
         return None
 
-def calculate_sma(data, window):
-    """Calculate Simple Moving Average for given window period"""
-    return data['Close'].rolling(window=window, min_periods=1).mean()
+def sma_last(close, window):
+    """Latest SMA value from the trailing window slice alone; NaNs are skipped like rolling(min_periods=1)"""
+    tail = close[-window:]
+    tail = tail[~np.isnan(tail)]
+    return tail.mean().item() if tail.size else float('nan')
+
+def latest_smas(sym, period, windows):
+    """Latest SMA value per window, recomputed only when the cached history is refetched"""
+    data = fetch_historical_data(sym, period)
+    if data is None or data.empty:
+        return None
+    key = (sym, period, windows)
+    cached = _sma_cache.get(key)
+    if cached and cached[0] is data:
+        return cached[1]
+    close = data['Close'].to_numpy(dtype=float)
+    levels = {w: sma_last(close, w) for w in windows}
+    _sma_cache[key] = (data, levels)
+    return levels
+
+def load_chart_backend():
+    """Import mplfinance and build the chart style on first use"""
+    global _chart_backend
+    with _chart_backend_lock:
+        if _chart_backend is None:
+            import matplotlib
+            matplotlib.use('Agg')  # charts are only ever saved to disk, never shown in a window
+            import mplfinance as mpf
+            style = mpf.make_mpf_style(
+                marketcolors=mpf.make_marketcolors(up='#00ff88', down='#ff4444', edge='inherit',
+                                                   wick={'up': '#00cc66', 'down': '#cc3333'},
+                                                   volume='#888888'),
+                gridstyle=':', y_on_right=True, facecolor='#0d1117', figcolor='#161b22')
+            _chart_backend = (mpf, style)
+    return _chart_backend
+
+def render_chart_png(data, sym):
+    """Save a candlestick chart with SMA overlays to a temporary PNG"""
+    try:
+        mpf, chart_style = load_chart_backend()
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
+            chart_path = tmp_file.name
+        with _chart_render_lock:
+            mpf.plot(data,
+                     type='candle',
+                     mav=SMA_WINDOWS,
+                     volume=True,
+                     style=chart_style,
+                     title=f'{sym} - Advanced Technical Analysis',
+                     ylabel='Price (₹)',
+                     savefig=dict(fname=chart_path, dpi=100, bbox_inches='tight'),
+                     figsize=(16, 10),
+                     closefig=True)
+        console.print(f"[green]✅ Professional chart saved: {chart_path}[/green]")
+    except Exception as e:
+        console.print(f"[red]Error saving chart for {sym}: {e}[/red]")
+
+def risk_levels(prices):
+    """Stop loss and take profit levels per risk profile; shape (..., profiles, 2) for scalar or array prices"""
+    return np.multiply.outer(np.asarray(prices, dtype=float), RISK_MULTIPLIERS)
 
-def show_ultimate_graph(sym, period="3mo"):
+def show_ultimate_graph(sym, period="3mo", save_png=False):
     """Ultimate graph with SMA lines, enhanced visuals and risk indicators"""
     data = fetch_historical_data(sym, period)
     if data is None or data.empty:
@@ -195,52 +865,27 @@ def show_ultimate_graph(sym, period="3mo"):
     console.print(Panel(f"🎯 ULTIMATE Technical Analysis for {sym} over {period}", title="📈 Advanced Market Analysis", style="bold blue"))
     
     try:
-        # Calculate multiple SMAs and technical indicators
-        sma_5 = calculate_sma(data, 5)
-        sma_20 = calculate_sma(data, 20)
-        sma_50 = calculate_sma(data, 50)
-        sma_200 = calculate_sma(data, 200) if len(data) >= 200 else sma_50
+        # Calculate all SMAs together and take the latest row once
+        smas = latest_smas(sym, period, SMA_WINDOWS)
+        latest_sma_5, latest_sma_20, latest_sma_50, latest_sma_200 = (smas[w] for w in SMA_WINDOWS)
+        if len(data) < 200:
+            latest_sma_200 = latest_sma_50
         
-        # Get latest values
         current_price = data['Close'].iloc[-1]
-        latest_sma_5 = sma_5.iloc[-1]
-        latest_sma_20 = sma_20.iloc[-1]
-        latest_sma_50 = sma_50.iloc[-1]
-        latest_sma_200 = sma_200.iloc[-1]
         
         # Calculate volatility
         volatility = data['Close'].pct_change().std() * 100
         
-        console.print("[cyan]📊 Generating professional chart with multiple SMA overlays...[/cyan]")
-        
-        # Create advanced chart with multiple SMAs
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp_file:
-            chart_path = tmp_file.name
-        
-        # Advanced styling
-        mc = mpf.make_marketcolors(up='#00ff88', down='#ff4444', edge='inherit',
-                                   wick={'up':'#00cc66', 'down':'#cc3333'},
-                                   volume='#888888')
-        
-        s = mpf.make_mpf_style(marketcolors=mc, gridstyle=':', y_on_right=True,
-                               facecolor='#0d1117', figcolor='#161b22')
-        
-        # Plot with multiple SMA lines
-        mpf.plot(data, 
-                type='candle',
-                mav=(5, 20, 50, 200),
-                volume=True,
-                style=s,
-                title=f'{sym} - Advanced Technical Analysis',
-                ylabel='Price (₹)',
-                savefig=dict(fname=chart_path, dpi=150, bbox_inches='tight'),
-                figsize=(16, 10))
-        
-        console.print(f"[green]✅ Professional chart saved: {chart_path}[/green]")
+        if save_png:
+            console.print("[cyan]📊 Generating professional chart in the background...[/cyan]")
+            threading.Thread(target=render_chart_png, args=(data, sym), name=f"chart-{sym}").start()
+        else:
+            console.print("[dim]💡 Add 'png' to the command to also save a high-resolution chart[/dim]")
         
         # Show terminal chart for quick reference
         console.print("\n[cyan]📊 Quick Terminal View:[/cyan]")
-        candles = [Candle(open=row.Open, high=row.High, low=row.Low, close=row.Close) for row in data.itertuples()]
+        ohlc = data[['Open', 'High', 'Low', 'Close']].to_numpy().tolist()
+        candles = [Candle(open=o, high=h, low=l, close=c) for o, h, l, c in ohlc]
         chart = Chart(candles, title=f"{sym} Live Chart")
         chart.set_bear_color(255, 68, 68)
         chart.set_bull_color(0, 255, 136)
@@ -286,11 +931,11 @@ def show_ultimate_graph(sym, period="3mo"):
         cross_signal = "🚀 Golden Cross" if latest_sma_20 > latest_sma_50 else "💀 Death Cross"
         cross_strength = "🔥 Strong" if abs((latest_sma_20 - latest_sma_50) / latest_sma_50 * 100) > 3 else "⚡ Moderate"
         
-        analysis_table.add_row("💰 Current Price", f"₹{current_price:.2f}", "", "", "")
-        analysis_table.add_row("⚡ SMA 5", f"₹{latest_sma_5:.2f}", sma5_signal, sma5_strength, sma5_rec)
-        analysis_table.add_row("📊 SMA 20", f"₹{latest_sma_20:.2f}", sma20_signal, sma20_strength, sma20_rec)
-        analysis_table.add_row("📈 SMA 50", f"₹{latest_sma_50:.2f}", sma50_signal, sma50_strength, sma50_rec)
-        analysis_table.add_row("🎯 SMA 200", f"₹{latest_sma_200:.2f}", sma200_signal, sma200_strength, sma200_rec)
+        analysis_table.add_row("💰 Current Price", PRICE_FMT(current_price), "", "", "")
+        analysis_table.add_row("⚡ SMA 5", PRICE_FMT(latest_sma_5), sma5_signal, sma5_strength, sma5_rec)
+        analysis_table.add_row("📊 SMA 20", PRICE_FMT(latest_sma_20), sma20_signal, sma20_strength, sma20_rec)
+        analysis_table.add_row("📈 SMA 50", PRICE_FMT(latest_sma_50), sma50_signal, sma50_strength, sma50_rec)
+        analysis_table.add_row("🎯 SMA 200", PRICE_FMT(latest_sma_200), sma200_signal, sma200_strength, sma200_rec)
         analysis_table.add_row("⚔️  Trend Signal", f"{latest_sma_20/latest_sma_50:.3f}", cross_signal, cross_strength, "")
         analysis_table.add_row("📊 Volatility", f"{volatility:.1f}%", "🔥 High" if volatility > 3 else "⚡ Medium" if volatility > 1.5 else "💫 Low", "", "")
         
@@ -303,18 +948,10 @@ def show_ultimate_graph(sym, period="3mo"):
         risk_table.add_column("Take Profit", style="green")
         risk_table.add_column("Position Size", style="cyan")
         
-        # Calculate risk levels
-        conservative_sl = current_price * 0.95  # 5% stop loss
-        moderate_sl = current_price * 0.92     # 8% stop loss  
-        aggressive_sl = current_price * 0.88   # 12% stop loss
-        
-        conservative_tp = current_price * 1.10  # 10% take profit
-        moderate_tp = current_price * 1.15     # 15% take profit
-        aggressive_tp = current_price * 1.25   # 25% take profit
-        
-        risk_table.add_row("🟢 Conservative", f"₹{conservative_sl:.2f}", f"₹{conservative_tp:.2f}", "25% of portfolio")
-        risk_table.add_row("🟡 Moderate", f"₹{moderate_sl:.2f}", f"₹{moderate_tp:.2f}", "15% of portfolio")
-        risk_table.add_row("🔴 Aggressive", f"₹{aggressive_sl:.2f}", f"₹{aggressive_tp:.2f}", "10% of portfolio")
+        # Stop loss / take profit for every risk level in one multiply
+        levels = risk_levels(current_price).tolist()
+        for (label, position_size), (stop_loss, take_profit) in zip(RISK_PROFILES, levels):
+            risk_table.add_row(label, PRICE_FMT(stop_loss), PRICE_FMT(take_profit), position_size)
         
         console.print(Panel(risk_table, title="💡 Smart Trading Suggestions", border_style="yellow"))
         
@@ -322,179 +959,290 @@ def show_ultimate_graph(sym, period="3mo"):
         console.print(f"[red]Error creating ultimate chart: {e}[/red]")
         console.print("[yellow]Falling back to simple chart...[/yellow]")
 
-def calculate_net_worth(user, stocks):
-    total_value = 0
-    for sym, data in user['portfolio'].items():
-        shares = data.get('shares', 0)
-        stock = next((s for s in stocks if s['symbol'] == sym), None)
+def invalidate_net_worth(user):
+    """Drop a user's cached net worth after their holdings change"""
+    _net_worth_cache.pop(id(user), None)
+
+def add_to_position(portfolio, sym, shares, price):
+    """Add bought shares to a holding, updating its average cost in place"""
+    position = portfolio.get(sym)
+    if position is None:
+        portfolio[sym] = {'shares': shares, 'avg_cost': price}
+    else:
+        old_shares = position['shares']
+        new_shares = old_shares + shares
+        position['avg_cost'] = (position['avg_cost'] * old_shares + price * shares) / new_shares
+        position['shares'] = new_shares
+
+def calculate_net_worth(user, stocks_by_sym):
+    # Reuse the last value until the holdings, balance or stocks snapshot change; the
+    # snapshot itself is kept and compared by identity, as a freed dict's id can be reused
+    cached = _net_worth_cache.get(id(user))
+    if (cached and cached[0] is stocks_by_sym and cached[1] == len(stocks_by_sym)
+            and cached[2] == user['balance']):
+        return cached[3]
+    
+    portfolio = user['portfolio']
+    fetched = fetch_missing_prices(portfolio, stocks_by_sym)
+    lookup, lookup_fetched = stocks_by_sym.get, fetched.get
+    shares, prices = [], []
+    for sym, position in portfolio.items():
+        stock = lookup(sym) or lookup_fetched(sym)
         if stock:
-            total_value += shares * stock['price']
-        else:
-            temp_stock = fetch_single_price(sym)
-            if temp_stock:
-                total_value += shares * temp_stock['price']
-    return user['balance'] + total_value
+            shares.append(position['shares'])
+            prices.append(stock['price'])
+    net_worth = user['balance'] + float(np.dot(np.array(shares, dtype=float), np.array(prices, dtype=float)))
+    # Prices fetched on demand expire on their own schedule, so only cache values priced from the snapshot
+    if not fetched:
+        _net_worth_cache[id(user)] = (stocks_by_sym, len(stocks_by_sym), user['balance'], net_worth)
+    return net_worth
+
+def leaderboard_top(leaderboard):
+    """Return the top leaderboard entries, rebuilding them only after they were invalidated"""
+    global _leaderboard_top
+    if _leaderboard_top is None:
+        _leaderboard_top = heapq.nlargest(LEADERBOARD_SIZE, leaderboard.items(), key=lambda x: x[1])
+    return _leaderboard_top
+
+def set_leaderboard_score(leaderboard, trader, score):
+    """Record a trader's score and patch the cached top entries without rescanning when possible"""
+    global _leaderboard_top
+    old_score = leaderboard.get(trader)
+    leaderboard[trader] = score
+    top = _leaderboard_top
+    if top is None:
+        return
+    if any(name == trader for name, _ in top):
+        # A trader outside the top entries may now outrank a falling one
+        if score < old_score and len(leaderboard) > len(top):
+            _leaderboard_top = None
+            return
+        top = [entry for entry in top if entry[0] != trader]
+    elif len(top) == LEADERBOARD_SIZE and score <= top[-1][1]:
+        return
+    top.append((trader, score))
+    top.sort(key=lambda x: x[1], reverse=True)
+    _leaderboard_top = top[:LEADERBOARD_SIZE]
 
-def check_stop_losses(user, stocks):
-    """Check and execute stop-loss orders automatically (including trailing stops)"""
+def remove_leaderboard_entry(leaderboard, trader):
+    global _leaderboard_top
+    if leaderboard.pop(trader, None) is not None and _leaderboard_top is not None:
+        if any(name == trader for name, _ in _leaderboard_top):
+            _leaderboard_top = None
+
+def stop_loss_triggers(current, stop, trailing, trailing_pct, highest):
+    """Vectorized stop-loss check over parallel arrays, one entry per stop order.
+
+    Returns the execute mask together with the (possibly trailed) stop prices
+    and highest prices."""
+    new_high = trailing & (current > highest)
+    highest = np.where(new_high, current, highest)
+    stop = np.where(new_high, highest * (1 - trailing_pct / 100), stop)
+    return current <= stop, stop, highest
+
+def triggered_order_ids(sym, price):
+    """Ids of the symbol's limit orders that fill at price: buys targeting at or above it, sells at or below"""
+    sides = _order_triggers.get(sym)
+    if not sides:
+        return []
+    matched = []
+    buys = sides.get('buy')
+    if buys:
+        matched += buys[1][bisect.bisect_left(buys[0], price):]
+    sells = sides.get('sell')
+    if sells:
+        matched += sells[1][:bisect.bisect_right(sells[0], price)]
+    return matched
+
+def prefetch_order_prices(user, stocks_by_sym):
+    """Warm the quote cache for all stop-loss and limit-order symbols missing from the stocks index"""
+    symbols = [*user['stop_losses'], *_order_triggers]
+    if symbols:
+        fetch_missing_prices(symbols, stocks_by_sym)
+
+def check_stop_losses(user, stocks_by_sym):
+    """Check and execute stop-loss orders automatically (including trailing stops);
+    returns the executed orders and whether any stop was changed"""
     executed_orders = []
-    stop_losses = user.get('stop_losses', {})
-    
-    for sym, stop_data in list(stop_losses.items()):
-        if sym not in user['portfolio']:
-            del stop_losses[sym]
-            continue
-            
-        # Get current price
-        stock = next((s for s in stocks if s['symbol'] == sym), None)
-        if not stock:
-            stock = fetch_single_price(sym)
+    stop_losses = user.get('stop_losses')
+    if not stop_losses:
+        return executed_orders, False
+    stale = stop_losses.keys() - user['portfolio'].keys()
+    for sym in stale:
+        del stop_losses[sym]
+    changed = bool(stale)
+    if not stop_losses:
+        return executed_orders, changed
+    fetched = fetch_missing_prices(stop_losses, stocks_by_sym)
+    
+    # Collect priced stops into parallel arrays for the trigger check
+    syms, prices = [], []
+    for sym in stop_losses:
+        stock = stocks_by_sym.get(sym) or fetched.get(sym)
+        if stock:
+            syms.append(sym)
+            prices.append(stock['price'])
+    if not syms:
+        return executed_orders, changed
+    
+    stops = [stop_losses[sym] for sym in syms]
+    current = np.array(prices, dtype=float)
+    trailing = np.array([bool(d.get('trailing', False)) for d in stops])
+    trailing_pct = np.array([d.get('trailing_percent') or 5 for d in stops], dtype=float)
+    highest = np.array([d.get('highest_price') or p for d, p in zip(stops, prices)], dtype=float)
+    execute, stop_prices, highs = stop_loss_triggers(current, np.array([d['price'] for d in stops], dtype=float),
+                                                     trailing, trailing_pct, highest)
+    
+    for i, sym in enumerate(syms):
+        stop_data = stops[i]
+        current_price = prices[i]
+        stop_price = stop_prices[i].item()
+        shares = stop_data['shares']
+        is_trailing = bool(trailing[i])
+        
+        # Persist a raised trailing high and its adjusted stop price
+        if highs[i] > highest[i]:
+            stop_data['highest_price'] = highs[i].item()
+            stop_data['price'] = stop_price
+            changed = True
         
-        if not stock:
+        if not execute[i]:
             continue
-            
-        current_price = stock['price']
-        stop_price = stop_data['price']
-        shares = stop_data['shares']
-        is_trailing = stop_data.get('trailing', False)
         
-        # Handle trailing stop logic
-        if is_trailing:
-            trailing_percent = stop_data.get('trailing_percent', 5)
-            highest_price = stop_data.get('highest_price', current_price)
-            
-            # Update highest price if current price is higher
-            if current_price > highest_price:
-                highest_price = current_price
-                stop_data['highest_price'] = highest_price
-                # Adjust stop price based on new high
-                new_stop_price = highest_price * (1 - trailing_percent / 100)
-                stop_data['price'] = new_stop_price
-                stop_price = new_stop_price
+        # Execute the stop loss
+        revenue = current_price * shares
+        user['balance'] += revenue
         
-        # Execute stop loss if price hits or goes below stop price
-        if current_price <= stop_price:
-            # Execute the stop loss
-            revenue = current_price * shares
-            user['balance'] += revenue
-            
-            # Update portfolio
-            if shares >= user['portfolio'][sym]['shares']:
-                del user['portfolio'][sym]
-            else:
-                user['portfolio'][sym]['shares'] -= shares
-            
-            # Remove the stop loss order
-            del stop_losses[sym]
-            
-            stop_type = "🚂 TRAILING STOP" if is_trailing else "🛡️  STOP LOSS"
-            
-            executed_orders.append({
-                'symbol': sym,
-                'shares': shares,
-                'price': current_price,
-                'revenue': revenue,
-                'stop_price': stop_price,
-                'trailing': is_trailing
-            })
-            
-            console.print(Panel(
-                f"{stop_type} [red]EXECUTED![/red]\n"
-                f"Symbol: {sym}\n"
-                f"Shares Sold: {shares}\n"
-                f"Stop Price: ₹{stop_price:.2f}\n"
-                f"Execution Price: ₹{current_price:.2f}\n"
-                f"Revenue: ₹{revenue:.2f}",
-                title="🚨 Stop Loss Alert",
-                border_style="red"
-            ))
+        # Update portfolio
+        portfolio = user['portfolio']
+        position = portfolio[sym]
+        if shares >= position['shares']:
+            del portfolio[sym]
+        else:
+            position['shares'] -= shares
+        invalidate_net_worth(user)
+        
+        # Remove the stop loss order
+        del stop_losses[sym]
+        changed = True
+        
+        stop_type = "🚂 TRAILING STOP" if is_trailing else "🛡️  STOP LOSS"
+        
+        executed_orders.append({
+            'symbol': sym,
+            'shares': shares,
+            'price': current_price,
+            'revenue': revenue,
+            'stop_price': stop_price,
+            'trailing': is_trailing
+        })
+        
+        console.print(Panel(
+            f"{stop_type} [red]EXECUTED![/red]\n"
+            f"Symbol: {sym}\n"
+            f"Shares Sold: {shares}\n"
+            f"Stop Price: ₹{stop_price:.2f}\n"
+            f"Execution Price: ₹{current_price:.2f}\n"
+            f"Revenue: ₹{revenue:.2f}",
+            title="🚨 Stop Loss Alert",
+            border_style="red"
+        ))
     
-    return executed_orders
+    return executed_orders, changed
 
-def process_limit_orders(pending_orders, stocks, users):
+def process_limit_orders(pending_orders, stocks_by_sym, users):
     """Process limit orders and execute when price conditions are met"""
     executed_orders = []
+    if not pending_orders:
+        return executed_orders
+    stale_users = [u for u in _orders_by_user if u not in users]
+    remove_orders(pending_orders, [order_id for u in stale_users for order_id in user_order_ids(u)])
+    if not pending_orders:
+        return executed_orders
+    fetched = fetch_missing_prices(_order_triggers, stocks_by_sym)
+    
+    # Look up only the orders each symbol's quote fills: {order_id: execution price}
+    fill_prices = {}
+    for sym in _order_triggers:
+        stock = stocks_by_sym.get(sym) or fetched.get(sym)
+        if stock:
+            for order_id in triggered_order_ids(sym, stock['price']):
+                fill_prices[order_id] = stock['price']
+    if not fill_prices:
+        return executed_orders
     
-    for order_id, order in list(pending_orders.items()):
+    done_ids = []
+    # Execute in placement order so earlier orders get first claim on the balance
+    for order_id in [order_id for order_id in pending_orders if order_id in fill_prices]:
+        order = pending_orders[order_id]
+        current_price = fill_prices[order_id]
+        
         sym = order['symbol']
         target_price = order['price']
         shares = order['shares']
         order_type = order['type']  # 'buy' or 'sell'
         username = order['user']
-        
-        if username not in users:
-            del pending_orders[order_id]
-            continue
-            
         user = users[username]
         
-        # Get current price
-        stock = next((s for s in stocks if s['symbol'] == sym), None)
-        if not stock:
-            stock = fetch_single_price(sym)
-        
-        if not stock:
-            continue
-            
-        current_price = stock['price']
-        
-        # Check if order should be executed
-        should_execute = False
-        if order_type == 'buy' and current_price <= target_price:
-            should_execute = True
-        elif order_type == 'sell' and current_price >= target_price:
-            should_execute = True
-        
-        if should_execute:
-            if order_type == 'buy':
-                cost = current_price * shares
-                if user['balance'] >= cost:
-                    # Execute buy order
-                    user['balance'] -= cost
-                    if sym not in user['portfolio']:
-                        user['portfolio'][sym] = {'shares': shares, 'avg_cost': current_price}
-                    else:
-                        old_data = user['portfolio'][sym]
-                        old_shares = old_data['shares']
-                        old_avg = old_data['avg_cost']
-                        new_shares = old_shares + shares
-                        new_avg = (old_avg * old_shares + current_price * shares) / new_shares
-                        user['portfolio'][sym] = {'shares': new_shares, 'avg_cost': new_avg}
-                    
-                    executed_orders.append({
-                        'type': 'buy',
-                        'symbol': sym,
-                        'shares': shares,
-                        'target_price': target_price,
-                        'execution_price': current_price,
-                        'cost': cost,
-                        'user': username
-                    })
-            
-            elif order_type == 'sell':
-                if sym in user['portfolio'] and user['portfolio'][sym]['shares'] >= shares:
-                    # Execute sell order
-                    revenue = current_price * shares
-                    user['balance'] += revenue
-                    user['portfolio'][sym]['shares'] -= shares
-                    if user['portfolio'][sym]['shares'] == 0:
-                        del user['portfolio'][sym]
-                    
-                    executed_orders.append({
-                        'type': 'sell',
-                        'symbol': sym,
-                        'shares': shares,
-                        'target_price': target_price,
-                        'execution_price': current_price,
-                        'revenue': revenue,
-                        'user': username
-                    })
-            
-            # Remove executed order
-            del pending_orders[order_id]
-    
+        if order_type == 'buy':
+            cost = current_price * shares
+            if user['balance'] >= cost:
+                # Execute buy order
+                user['balance'] -= cost
+                add_to_position(user['portfolio'], sym, shares, current_price)
+                invalidate_net_worth(user)
+                
+                executed_orders.append({
+                    'type': 'buy',
+                    'symbol': sym,
+                    'shares': shares,
+                    'target_price': target_price,
+                    'execution_price': current_price,
+                    'cost': cost,
+                    'user': username
+                })
+        
+        elif order_type == 'sell':
+            portfolio = user['portfolio']
+            position = portfolio.get(sym)
+            if position and position['shares'] >= shares:
+                # Execute sell order
+                revenue = current_price * shares
+                user['balance'] += revenue
+                position['shares'] -= shares
+                if position['shares'] == 0:
+                    del portfolio[sym]
+                invalidate_net_worth(user)
+                
+                executed_orders.append({
+                    'type': 'sell',
+                    'symbol': sym,
+                    'shares': shares,
+                    'target_price': target_price,
+                    'execution_price': current_price,
+                    'revenue': revenue,
+                    'user': username
+                })
+        
+        done_ids.append(order_id)
+    
+    # Remove executed orders
+    remove_orders(pending_orders, done_ids)
     return executed_orders
 
+def partition_by_change(stocks):
+    """Split stocks into (gainers, losers, unchanged count) in one pass, keeping order"""
+    gainers, losers, unchanged = [], [], 0
+    for stock in stocks:
+        change = stock.get('change', 0)
+        if change > 0:
+            gainers.append(stock)
+        elif change < 0:
+            losers.append(stock)
+        else:
+            unchanged += 1
+    return gainers, losers, unchanged
+
 def show_enhanced_prices(stocks, specific_sym=None):
     """Enhanced price display with advanced formatting"""
     enhanced_loading_animation("Loading market data...")
@@ -508,12 +1256,12 @@ def show_enhanced_prices(stocks, specific_sym=None):
             price_table.add_column("Value", justify="right", style="green", width=12)
             price_table.add_column("Status", justify="center", width=15)
             
-            change_str = f"{stock['change']:+.2f}%"
+            change_str = PCT_FMT(stock['change'])
             trend_emoji = "🚀" if stock['change'] > 2 else "📈" if stock['change'] > 0 else "📉" if stock['change'] < 0 else "➡️"
             color = "bright_green" if stock['change'] > 0 else "bright_red" if stock['change'] < 0 else "white"
             
-            price_table.add_row("💰 Current Price", f"₹{stock['price']:.2f}", "")
-            price_table.add_row("📊 Previous Close", f"₹{stock['last_price']:.2f}", "")
+            price_table.add_row("💰 Current Price", PRICE_FMT(stock['price']), "")
+            price_table.add_row("📊 Previous Close", PRICE_FMT(stock['last_price']), "")
             price_table.add_row("📈 Change", f"[{color}]{change_str}[/{color}]", f"{trend_emoji}")
             price_table.add_row("🕐 Updated", datetime.now().strftime("%H:%M:%S"), "Live")
             
@@ -528,27 +1276,20 @@ def show_enhanced_prices(stocks, specific_sym=None):
         return
         
     # Split into gainers and losers
-    gainers = [s for s in sorted_stocks if s.get('change', 0) > 0][:5]
-    losers = [s for s in sorted_stocks if s.get('change', 0) < 0][-5:]
+    all_gainers, all_losers, unchanged_stocks = partition_by_change(sorted_stocks)
+    gainers = all_gainers[:5]
+    losers = all_losers[-5:]
     
     # Create columns layout
-    left_panel = Table(title="🚀 Top Gainers", style="bold green", expand=True)
-    left_panel.add_column("Symbol", style="cyan")
-    left_panel.add_column("Price", justify="right", style="white")
-    left_panel.add_column("Change", justify="right")
-    
-    right_panel = Table(title="📉 Top Losers", style="bold red", expand=True)
-    right_panel.add_column("Symbol", style="cyan")
-    right_panel.add_column("Price", justify="right", style="white")
-    right_panel.add_column("Change", justify="right")
+    left_panel = build_movers_table("🚀 Top Gainers", "bold green")
+    right_panel = build_movers_table("📉 Top Losers", "bold red")
     
-    for stock in gainers:
-        change_str = f"+{stock.get('change', 0):.2f}%"
-        left_panel.add_row(stock.get('symbol', 'N/A'), f"₹{stock.get('price', 0):.2f}", f"[bright_green]{change_str}[/bright_green]")
-    
-    for stock in losers:
-        change_str = f"{stock.get('change', 0):.2f}%"
-        right_panel.add_row(stock.get('symbol', 'N/A'), f"₹{stock.get('price', 0):.2f}", f"[bright_red]{change_str}[/bright_red]")
+    gainer_rows = [(s.get('symbol', 'N/A'), PRICE_FMT(s.get('price', 0)), GAIN_PCT_FMT(s.get('change', 0))) for s in gainers]
+    loser_rows = [(s.get('symbol', 'N/A'), PRICE_FMT(s.get('price', 0)), LOSS_PCT_FMT(s.get('change', 0))) for s in losers]
+    for row in gainer_rows:
+        left_panel.add_row(*row)
+    for row in loser_rows:
+        right_panel.add_row(*row)
     
     # Display in columns
     console.print(Columns([
@@ -557,11 +1298,7 @@ def show_enhanced_prices(stocks, specific_sym=None):
     ]))
     
     # Market summary
-    total_stocks = len(sorted_stocks)
-    gaining_stocks = len([s for s in sorted_stocks if s.get('change', 0) > 0])
-    losing_stocks = len([s for s in sorted_stocks if s.get('change', 0) < 0])
-    
-    summary_text = f"📊 Market Summary: {gaining_stocks} gaining • {losing_stocks} declining • {total_stocks - gaining_stocks - losing_stocks} unchanged"
+    summary_text = f"📊 Market Summary: {len(all_gainers)} gaining • {len(all_losers)} declining • {unchanged_stocks} unchanged"
     console.print(Panel(summary_text, title="📈 Market Overview", style="bold blue"))
 
 def show_top10(stocks):
@@ -577,27 +1314,21 @@ def show_top10(stocks):
     
     # Top 10 gainers
     gainers = sorted_stocks[:10]
-    gainers_table = Table(title="🚀 Top 10 Gainers", style="bold green", expand=True)
-    gainers_table.add_column("Rank", style="cyan", width=5)
-    gainers_table.add_column("Symbol", style="white", width=10)
-    gainers_table.add_column("Price", justify="right", style="green", width=12)
-    gainers_table.add_column("Change", justify="right", width=10)
+    gainers_table = build_ranked_table("🚀 Top 10 Gainers", "bold green", "green")
     
-    for rank, stock in enumerate(gainers, 1):
-        change_str = f"+{stock.get('change', 0):.2f}%"
-        gainers_table.add_row(str(rank), stock.get('symbol', 'N/A'), f"₹{stock.get('price', 0):.2f}", f"[bright_green]{change_str}[/bright_green]")
+    gainer_rows = [(str(rank), s.get('symbol', 'N/A'), PRICE_FMT(s.get('price', 0)), GAIN_PCT_FMT(s.get('change', 0)))
+                   for rank, s in enumerate(gainers, 1)]
+    for row in gainer_rows:
+        gainers_table.add_row(*row)
     
     # Top 10 losers
     losers = sorted_stocks[-10:][::-1]  # Reverse to show from least to most loss
-    losers_table = Table(title="📉 Top 10 Losers", style="bold red", expand=True)
-    losers_table.add_column("Rank", style="cyan", width=5)
-    losers_table.add_column("Symbol", style="white", width=10)
-    losers_table.add_column("Price", justify="right", style="red", width=12)
-    losers_table.add_column("Change", justify="right", width=10)
+    losers_table = build_ranked_table("📉 Top 10 Losers", "bold red", "red")
     
-    for rank, stock in enumerate(losers, 1):
-        change_str = f"{stock.get('change', 0):.2f}%"
-        losers_table.add_row(str(rank), stock.get('symbol', 'N/A'), f"₹{stock.get('price', 0):.2f}", f"[bright_red]{change_str}[/bright_red]")
+    loser_rows = [(str(rank), s.get('symbol', 'N/A'), PRICE_FMT(s.get('price', 0)), LOSS_PCT_FMT(s.get('change', 0)))
+                  for rank, s in enumerate(losers, 1)]
+    for row in loser_rows:
+        losers_table.add_row(*row)
     
     # Display in columns
     console.print(Columns([
@@ -606,10 +1337,8 @@ def show_top10(stocks):
     ]))
     
     # Market summary
-    total_stocks = len(sorted_stocks)
-    gaining_stocks = len([s for s in sorted_stocks if s.get('change', 0) > 0])
-    losing_stocks = len([s for s in sorted_stocks if s.get('change', 0) < 0])
-    summary_text = f"📊 Market Summary: {gaining_stocks} gaining • {losing_stocks} declining • {total_stocks - gaining_stocks - losing_stocks} unchanged"
+    gaining_stocks, losing_stocks, unchanged_stocks = partition_by_change(sorted_stocks)
+    summary_text = f"📊 Market Summary: {len(gaining_stocks)} gaining • {len(losing_stocks)} declining • {unchanged_stocks} unchanged"
     console.print(Panel(summary_text, title="📈 Daily Market Overview", style="bold blue"))
 
 def set_stop_loss(user, sym, shares, stop_price, trailing=False, trailing_percent=None):
@@ -662,14 +1391,12 @@ def set_stop_loss(user, sym, shares, stop_price, trailing=False, trailing_percen
     ))
     return True
 
-def advanced_sell_analysis(user, sym, stocks):
+def advanced_sell_analysis(user, sym, stocks_by_sym):
     """Provide advanced selling recommendations based on technical analysis"""
     if sym not in user['portfolio']:
         return None
     
-    stock = next((s for s in stocks if s['symbol'] == sym), None)
-    if not stock:
-        stock = fetch_single_price(sym)
+    stock = get_price(sym, stocks_by_sym)
     
     if not stock:
         return None
@@ -678,14 +1405,11 @@ def advanced_sell_analysis(user, sym, stocks):
     user_avg_cost = user['portfolio'][sym]['avg_cost']
     profit_loss_pct = ((current_price - user_avg_cost) / user_avg_cost) * 100
     
-    # Fetch historical data for technical analysis
-    data = fetch_historical_data(sym, "3mo")
-    if data is None or data.empty:
+    # Technical indicators from cached history
+    smas = latest_smas(sym, "3mo", (20, 50))
+    if smas is None:
         return None
-    
-    # Calculate technical indicators
-    sma_20 = calculate_sma(data, 20).iloc[-1]
-    sma_50 = calculate_sma(data, 50).iloc[-1]
+    sma_20, sma_50 = smas[20], smas[50]
     
     # Analyze selling conditions
     recommendations = []
@@ -717,7 +1441,7 @@ def advanced_sell_analysis(user, sym, stocks):
         'sma_50': sma_50
     }
 
-def sell_percentage(user, sym, percentage, stocks):
+def sell_percentage(user, sym, percentage, stocks_by_sym):
     """Sell a percentage of holdings in a stock"""
     if sym not in user['portfolio']:
         console.print("[red]❌ You don't own this stock.[/red]")
@@ -735,9 +1459,7 @@ def sell_percentage(user, sym, percentage, stocks):
         return False
     
     # Get current price
-    stock = next((s for s in stocks if s['symbol'] == sym), None)
-    if not stock:
-        stock = fetch_single_price(sym)
+    stock = get_price(sym, stocks_by_sym)
     
     if not stock:
         console.print("[red]❌ Unable to fetch current price.[/red]")
@@ -761,10 +1483,12 @@ def sell_percentage(user, sym, percentage, stocks):
     if confirm == 'yes':
         # Execute the sale
         user['balance'] += revenue
-        user['portfolio'][sym]['shares'] -= shares_to_sell
+        position = user['portfolio'][sym]
+        position['shares'] -= shares_to_sell
         
-        if user['portfolio'][sym]['shares'] == 0:
+        if position['shares'] == 0:
             del user['portfolio'][sym]
+        invalidate_net_worth(user)
         
         console.print(Panel(
             f"✅ Successfully sold {shares_to_sell} shares ({percentage}%) of {sym}\n"
@@ -785,7 +1509,7 @@ def conditional_sell(user, pending_orders, username, sym, shares, conditions):
     if condition_type == 'sma_cross':
         # Sell when price crosses below SMA
         sma_period = conditions.get('sma_period', 20)
-        order_id = f"{username}_{sym}_sma_cross_{int(time.time())}"
+        order_id = f"{username}_{sym}_sma_cross_{next(_order_seq)}"
         
         order = {
             'user': username,
@@ -796,11 +1520,11 @@ def conditional_sell(user, pending_orders, username, sym, shares, conditions):
                 'type': 'sma_cross_below',
                 'sma_period': sma_period
             },
-            'created_time': datetime.now().isoformat(),
+            'created_time_ns': time.time_ns(),
             'status': 'pending'
         }
         
-        pending_orders[order_id] = order
+        add_order(pending_orders, order_id, order)
         
         console.print(Panel(
             f"🎯 Conditional sell order created!\n"
@@ -817,7 +1541,7 @@ def conditional_sell(user, pending_orders, username, sym, shares, conditions):
 
 def place_limit_order(pending_orders, username, sym, shares, target_price, order_type):
     """Place a limit order (buy/sell at specific price)"""
-    order_id = f"{username}_{sym}_{order_type}_{int(time.time())}"
+    order_id = f"{username}_{sym}_{order_type}_{next(_order_seq)}"
     
     order = {
         'user': username,
@@ -825,11 +1549,11 @@ def place_limit_order(pending_orders, username, sym, shares, target_price, order
         'shares': shares,
         'price': target_price,
         'type': order_type,
-        'created_time': datetime.now().isoformat(),
+        'created_time_ns': time.time_ns(),
         'status': 'pending'
     }
     
-    pending_orders[order_id] = order
+    add_order(pending_orders, order_id, order)
     
     console.print(Panel(
         f"📋 Limit order placed successfully!\n"
@@ -844,18 +1568,24 @@ def place_limit_order(pending_orders, username, sym, shares, target_price, order
     ))
     return order_id
 
-def show_help_menu(username=None):
-    """Display comprehensive help menu with all available commands"""
+def get_help_panel(name, build):
+    """Return the cached help panel for name, building it on first use"""
+    panel = _help_panels.get(name)
+    if panel is None:
+        panel = _help_panels[name] = build()
+    return panel
+
+def build_help_panel():
     help_table = Table(title="🎯 ULTIMATE STOCK TRADER - COMMAND REFERENCE", style="bold cyan", expand=True)
     help_table.add_column("Category", style="bold blue", width=20)
     help_table.add_column("Command", style="bold green", width=25) 
     help_table.add_column("Description", style="white", width=40)
     
     # Market Data Commands
-    help_table.add_row("📊 Market Data", "prices [symbol]", "Live market prices & top movers")
+    help_table.add_row("📊 Market Data", "prices \\[symbol]", "Live market prices & top movers")
     help_table.add_row("", "top10", "Show top 10 gainers and losers for the day")
-    help_table.add_row("", "graph <symbol> [period]", "Technical analysis with SMA overlays") 
-    help_table.add_row("", "details <symbol>", "Comprehensive stock information")
+    help_table.add_row("", "graph <symbol> \\[period] \\[png]", "Technical analysis with SMA overlays (png saves a chart)") 
+    help_table.add_row("", "details <symbol> \\[full]", "Comprehensive stock information (full adds P/E & dividend)")
     
     # Trading Commands
     help_table.add_row("💱 Trading", "buy <symbol> <shares>", "Market buy order")
@@ -869,7 +1599,7 @@ def show_help_menu(username=None):
     help_table.add_row("🛡️ Risk Mgmt", "stoploss <symbol> <shares> <price>", "Set stop-loss protection")
     help_table.add_row("", "trailstop <symbol> <shares> <percent>", "Set trailing stop-loss")
     help_table.add_row("", "orders", "View all active orders")
-    help_table.add_row("", "cancel <type> [symbol]", "Cancel orders (stoploss/limit)")
+    help_table.add_row("", "cancel <type> \\[symbol]", "Cancel orders (stoploss/limit)")
     
     # Portfolio & Tools
     help_table.add_row("📋 Portfolio", "portfolio", "Advanced portfolio analysis")
@@ -878,36 +1608,29 @@ def show_help_menu(username=None):
     help_table.add_row("", "refresh", "Update market data")
     help_table.add_row("", "quit", "Exit application")
     
-    console.print(Panel(help_table, border_style="cyan", padding=(1, 2)))
+    return Panel(help_table, border_style="cyan", padding=(1, 2))
+
+def build_tips_panel(admin):
+    return Panel(QUICK_START_TIPS + ADMIN_TIP if admin else QUICK_START_TIPS,
+                 title="🚀 Getting Started", border_style="green")
+
+def show_help_menu(admin=False):
+    """Display comprehensive help menu with all available commands"""
+    console.print(get_help_panel('commands', build_help_panel))
     
     # Show admin commands if user is admin
-    if username and is_admin(username):
+    if admin:
         console.print("\n")
         show_admin_help()
     
-    # Quick start tips
-    tips = """
-💡 [bold]Quick Start Tips:[/bold]
-• Type [green]prices[/green] to see current market prices
-• Use [green]buy RELIANCE 10[/green] to buy 10 shares of RELIANCE
-• Set protection with [yellow]stoploss RELIANCE 10 2500[/yellow]
-• View your holdings with [magenta]portfolio[/magenta]
-• Check top performers with [cyan]top10[/cyan]
-• Get help anytime with [cyan]help[/cyan]
-    """
-    admin_tip = ""
-    if username and is_admin(username):
-        admin_tip = "\n🔧 [bold red]Admin Mode Active![/bold red] Use admin commands above for system management."
-        
-    console.print(Panel(tips + admin_tip, title="🚀 Getting Started", border_style="green"))
+    tips_key = 'admin_tips' if admin else 'tips'
+    console.print(get_help_panel(tips_key, lambda: build_tips_panel(admin)))
 
 def is_admin(username):
     """Check if user has admin privileges"""
-    admin_users = ['admin', 'administrator', 'root', 'superuser']
-    return username.lower() in admin_users
+    return username.lower() in _ADMIN_USERS
 
-def show_admin_help():
-    """Display admin-specific help menu"""
+def build_admin_help_panel():
     admin_table = Table(title="🔧 ADMIN COMMANDS - Privileged Access", style="bold red", expand=True)
     admin_table.add_column("Command", style="bold red", width=30)
     admin_table.add_column("Description", style="white", width=50)
@@ -922,7 +1645,11 @@ def show_admin_help():
     admin_table.add_row("stats", "Show system statistics")
     admin_table.add_row("clearorders", "Clear all pending orders")
     
-    console.print(Panel(admin_table, border_style="red", padding=(1, 2)))
+    return Panel(admin_table, border_style="red", padding=(1, 2))
+
+def show_admin_help():
+    """Display admin-specific help menu"""
+    console.print(get_help_panel('admin', build_admin_help_panel))
 
 def list_all_users(users):
     """Admin function to list all users with their info"""
@@ -939,22 +1666,21 @@ def list_all_users(users):
     user_table.add_column("Stop Losses", style="red", width=10)
     
     for username, data in users.items():
-        balance = data.get('balance', 0)
-        portfolio = data.get('portfolio', {})
-        stop_losses = data.get('stop_losses', {})
+        balance = data['balance']
+        portfolio = data['portfolio']
+        stop_losses = data['stop_losses']
         
         # Calculate portfolio value (simplified)
-        portfolio_value = sum(stock_data.get('shares', 0) * stock_data.get('avg_cost', 0) 
-                            for stock_data in portfolio.values())
+        portfolio_value = sum(position['shares'] * position['avg_cost'] for position in portfolio.values())
         net_worth = balance + portfolio_value
         holdings_count = len(portfolio)
         stop_loss_count = len(stop_losses)
         
         user_table.add_row(
             username,
-            f"₹{balance:,.2f}",
-            f"₹{portfolio_value:,.2f}",
-            f"₹{net_worth:,.2f}",
+            PRICE_FMT(balance),
+            PRICE_FMT(portfolio_value),
+            PRICE_FMT(net_worth),
             str(holdings_count),
             str(stop_loss_count)
         )
@@ -968,16 +1694,16 @@ def get_user_info(users, target_username):
         return
     
     user_data = users[target_username]
-    balance = user_data.get('balance', 0)
-    portfolio = user_data.get('portfolio', {})
-    stop_losses = user_data.get('stop_losses', {})
+    balance = user_data['balance']
+    portfolio = user_data['portfolio']
+    stop_losses = user_data['stop_losses']
     
     # User info table
     info_table = Table(title=f"👤 User Profile: {target_username}", style="bold green", expand=True)
     info_table.add_column("Attribute", style="bold blue", width=20)
     info_table.add_column("Value", style="white", width=30)
     
-    info_table.add_row("💰 Cash Balance", f"₹{balance:,.2f}")
+    info_table.add_row("💰 Cash Balance", PRICE_FMT(balance))
     info_table.add_row("📊 Active Holdings", str(len(portfolio)))
     info_table.add_row("🛡️  Active Stop Losses", str(len(stop_losses)))
     
@@ -992,15 +1718,15 @@ def get_user_info(users, target_username):
         port_table.add_column("Total Investment", style="cyan")
         
         for symbol, stock_data in portfolio.items():
-            shares = stock_data.get('shares', 0)
-            avg_cost = stock_data.get('avg_cost', 0)
+            shares = stock_data['shares']
+            avg_cost = stock_data['avg_cost']
             total_investment = shares * avg_cost
             
             port_table.add_row(
                 symbol,
                 str(shares),
-                f"₹{avg_cost:.2f}",
-                f"₹{total_investment:,.2f}"
+                UNIT_PRICE_FMT(avg_cost),
+                PRICE_FMT(total_investment)
             )
         
         console.print(Panel(port_table, border_style="cyan"))
@@ -1022,7 +1748,7 @@ def get_user_info(users, target_username):
             stop_table.add_row(
                 symbol,
                 str(shares),
-                f"₹{stop_price:.2f}",
+                UNIT_PRICE_FMT(stop_price),
                 stop_type
             )
         
@@ -1031,9 +1757,11 @@ def get_user_info(users, target_username):
 def system_stats(users, pending_orders):
     """Show comprehensive system statistics"""
     total_users = len(users)
-    total_cash = sum(user.get('balance', 0) for user in users.values())
-    total_holdings = sum(len(user.get('portfolio', {})) for user in users.values())
-    total_stop_losses = sum(len(user.get('stop_losses', {})) for user in users.values())
+    total_cash = total_holdings = total_stop_losses = 0
+    for user in users.values():
+        total_cash += user['balance']
+        total_holdings += len(user['portfolio'])
+        total_stop_losses += len(user['stop_losses'])
     total_pending_orders = len(pending_orders)
     
     stats_table = Table(title="📊 System Statistics", style="bold magenta", expand=True)
@@ -1041,13 +1769,20 @@ def system_stats(users, pending_orders):
     stats_table.add_column("Value", style="bold white", width=20)
     
     stats_table.add_row("👥 Total Users", str(total_users))
-    stats_table.add_row("💰 Total Cash in System", f"₹{total_cash:,.2f}")
+    stats_table.add_row("💰 Total Cash in System", PRICE_FMT(total_cash))
     stats_table.add_row("📈 Total Holdings", str(total_holdings))
     stats_table.add_row("🛡️  Total Stop Losses", str(total_stop_losses))
     stats_table.add_row("📋 Pending Orders", str(total_pending_orders))
     
     console.print(Panel(stats_table, border_style="magenta", padding=(1, 2)))
 
+def set_time_label(iso_time):
+    """Short display form of an ISO set time, parsed once per distinct timestamp"""
+    label = _set_time_labels.get(iso_time)
+    if label is None:
+        label = _set_time_labels[iso_time] = datetime.fromisoformat(iso_time).strftime("%m/%d %H:%M")
+    return label
+
 def show_orders_status(user, pending_orders, username):
     """Show status of all active orders"""
     # Show stop losses
@@ -1060,13 +1795,12 @@ def show_orders_status(user, pending_orders, username):
         sl_table.add_column("Set Time", style="white")
         
         for sym, data in stop_losses.items():
-            set_time = datetime.fromisoformat(data['set_time']).strftime("%m/%d %H:%M")
-            sl_table.add_row(sym, str(data['shares']), f"₹{data['price']:.2f}", set_time)
+            sl_table.add_row(sym, str(data['shares']), UNIT_PRICE_FMT(data['price']), set_time_label(data['set_time']))
         
         console.print(Panel(sl_table, border_style="red"))
     
     # Show limit orders
-    user_limit_orders = {k: v for k, v in pending_orders.items() if v['user'] == username}
+    user_limit_orders = {order_id: pending_orders[order_id] for order_id in user_order_ids(username)}
     if user_limit_orders:
         lo_table = Table(title="📋 Active Limit Orders", style="bold blue")
         lo_table.add_column("Order ID", style="cyan", width=20)
@@ -1083,7 +1817,7 @@ def show_orders_status(user, pending_orders, username):
                 order_type,
                 order['symbol'],
                 str(order['shares']),
-                f"₹{order['price']:.2f}",
+                UNIT_PRICE_FMT(order['price']),
                 "⏳ Pending"
             )
         
@@ -1106,23 +1840,16 @@ def cancel_order(user, pending_orders, username, order_type, symbol=None):
             console.print(f"[red]❌ No stop loss found for {symbol}.[/red]")
     
     elif order_type == "limit":
-        user_orders = [k for k, v in pending_orders.items() if v['user'] == username]
-        if symbol:
-            cancelled = []
-            for order_id in list(user_orders):
-                if pending_orders[order_id]['symbol'] == symbol:
-                    del pending_orders[order_id]
-                    cancelled.append(order_id)
-            if cancelled:
-                console.print(f"[green]✅ {len(cancelled)} limit order(s) for {symbol} cancelled.[/green]")
-            else:
-                console.print(f"[red]❌ No limit orders found for {symbol}.[/red]")
+        cancelled = user_order_ids(username, symbol)
+        remove_orders(pending_orders, cancelled)
+        if not symbol:
+            console.print(f"[green]✅ {len(cancelled)} limit order(s) cancelled.[/green]")
+        elif cancelled:
+            console.print(f"[green]✅ {len(cancelled)} limit order(s) for {symbol} cancelled.[/green]")
         else:
-            for order_id in user_orders:
-                del pending_orders[order_id]
-            console.print(f"[green]✅ {len(user_orders)} limit order(s) cancelled.[/green]")
+            console.print(f"[red]❌ No limit orders found for {symbol}.[/red]")
 
-def show_enhanced_portfolio(user, stocks):
+def show_enhanced_portfolio(user, stocks_by_sym):
     """Enhanced portfolio display with advanced metrics"""
     enhanced_loading_animation("Analyzing portfolio...")
     
@@ -1136,64 +1863,39 @@ def show_enhanced_portfolio(user, stocks):
     portfolio_table.add_column("P/L %", justify="right", width=8)
     portfolio_table.add_column("Allocation", justify="center", width=10)
     
-    total_value = 0
-    total_pl = 0
-    total_invested = 0
-    
-    for sym, data in user['portfolio'].items():
-        shares = data.get('shares', 0)
-        avg_cost = data.get('avg_cost', 0.0)
-        invested_amount = shares * avg_cost
-        
-        stock = next((s for s in stocks if s['symbol'] == sym), None)
-        if not stock:
-            stock = fetch_single_price(sym)
-        current_price = stock['price'] if stock and isinstance(stock, dict) else avg_cost
-        
-        market_value = shares * current_price
-        pl_amount = market_value - invested_amount
-        pl_percentage = (pl_amount / invested_amount * 100) if invested_amount > 0 else 0
-        
-        # Calculate allocation percentage (will be updated after total is known)
-        total_value += market_value
-        total_pl += pl_amount
-        total_invested += invested_amount
-    
-    # Now add rows with allocation percentages
-    for sym, data in user['portfolio'].items():
-        shares = data.get('shares', 0)
-        avg_cost = data.get('avg_cost', 0.0)
-        invested_amount = shares * avg_cost
-        
-        stock = next((s for s in stocks if s['symbol'] == sym), None)
-        if not stock:
-            stock = fetch_single_price(sym)
-        current_price = stock['price'] if stock and isinstance(stock, dict) else avg_cost
-        
-        market_value = shares * current_price
-        pl_amount = market_value - invested_amount
-        pl_percentage = (pl_amount / invested_amount * 100) if invested_amount > 0 else 0
-        allocation = (market_value / total_value * 100) if total_value > 0 else 0
-        
+    # Price every holding once, then value the whole portfolio as parallel arrays
+    portfolio = user['portfolio']
+    fetched = fetch_missing_prices(portfolio, stocks_by_sym)
+    lookup, lookup_fetched = stocks_by_sym.get, fetched.get
+    symbols = list(portfolio)
+    positions = list(portfolio.values())
+    quotes = [lookup(sym) or lookup_fetched(sym) for sym in symbols]
+    shares = np.array([p['shares'] for p in positions], dtype=float)
+    avg_cost = np.array([p['avg_cost'] for p in positions], dtype=float)
+    # Holdings without a quote are valued at cost
+    prices = np.array([q['price'] if q else p['avg_cost'] for q, p in zip(quotes, positions)], dtype=float)
+    
+    invested = shares * avg_cost
+    market_value = shares * prices
+    pl = market_value - invested
+    total_value = market_value.sum().item()
+    total_pl = pl.sum().item()
+    total_invested = invested.sum().item()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pl_pct = np.where(invested > 0, pl / invested * 100, 0.0)
+        allocation = market_value / total_value * 100 if total_value > 0 else np.zeros_like(market_value)
+    
+    rows = []
+    for sym, position, cost, price, value, pl_amount, pl_percentage, alloc in zip(
+            symbols, positions, avg_cost.tolist(), prices.tolist(), market_value.tolist(),
+            pl.tolist(), pl_pct.tolist(), allocation.tolist()):
         # Color coding for P/L
-        pl_color = "bright_green" if pl_amount > 0 else "bright_red" if pl_amount < 0 else "white"
-        pl_amount_str = f"[{pl_color}]{pl_amount:+,.2f}[/{pl_color}]"
-        pl_percentage_str = f"[{pl_color}]{pl_percentage:+.1f}%[/{pl_color}]"
-        
-        # Progress bar for allocation
-        allocation_bar = "█" * int(allocation / 10) + "░" * (10 - int(allocation / 10))
-        allocation_str = f"{allocation:.1f}%"
-        
-        portfolio_table.add_row(
-            sym, 
-            str(shares), 
-            f"₹{avg_cost:.2f}",
-            f"₹{current_price:.2f}", 
-            f"₹{market_value:,.2f}",
-            pl_amount_str,
-            pl_percentage_str,
-            allocation_str
-        )
+        pl_amount_fmt, pl_pct_fmt = GAIN_PL_FMTS if pl_amount > 0 else LOSS_PL_FMTS if pl_amount < 0 else FLAT_PL_FMTS
+        rows.append((sym, str(position['shares']), UNIT_PRICE_FMT(cost), UNIT_PRICE_FMT(price),
+                     PRICE_FMT(value), pl_amount_fmt(pl_amount), pl_pct_fmt(pl_percentage),
+                     f"{alloc:.1f}%"))
+    for row in rows:
+        portfolio_table.add_row(*row)
     
     net_worth = user['balance'] + total_value
     overall_return = (total_pl / total_invested * 100) if total_invested > 0 else 0
@@ -1207,26 +1909,664 @@ def show_enhanced_portfolio(user, stocks):
     summary_table.add_column(style="bold cyan", justify="right")
     summary_table.add_column(style="bold white")
     
-    pl_color = "bright_green" if total_pl > 0 else "bright_red" if total_pl < 0 else "white"
-    return_color = "bright_green" if overall_return > 0 else "bright_red" if overall_return < 0 else "white"
+    pl_fmt = GAIN_CASH_FMT if total_pl > 0 else LOSS_CASH_FMT if total_pl < 0 else FLAT_CASH_FMT
+    return_fmt = (GAIN_PL_FMTS if overall_return > 0 else LOSS_PL_FMTS if overall_return < 0 else FLAT_PL_FMTS)[1]
     
-    summary_table.add_row("💰 Cash Balance:", f"₹{user['balance']:,.2f}", "📊 Portfolio Value:", f"₹{total_value:,.2f}")
-    summary_table.add_row("💎 Net Worth:", f"₹{net_worth:,.2f}", "💰 Total Invested:", f"₹{total_invested:,.2f}")
-    summary_table.add_row("📈 Total P/L:", f"[{pl_color}]₹{total_pl:+,.2f}[/{pl_color}]", "📊 Overall Return:", f"[{return_color}]{overall_return:+.1f}%[/{return_color}]")
-    summary_table.add_row("📋 Holdings:", f"{len(user['portfolio'])} stocks", "🛡️  Stop Losses:", f"{len(user.get('stop_losses', {}))} active")
+    summary_table.add_row("💰 Cash Balance:", PRICE_FMT(user['balance']), "📊 Portfolio Value:", PRICE_FMT(total_value))
+    summary_table.add_row("💎 Net Worth:", PRICE_FMT(net_worth), "💰 Total Invested:", PRICE_FMT(total_invested))
+    summary_table.add_row("📈 Total P/L:", pl_fmt(total_pl), "📊 Overall Return:", return_fmt(overall_return))
+    summary_table.add_row("📋 Holdings:", f"{len(user['portfolio'])} stocks", "🛡️  Stop Losses:", f"{len(user['stop_losses'])} active")
     
     console.print(Panel(summary_table, title="💼 Portfolio Summary", border_style="green"))
 
+def handle_help(ctx, parts):
+    """Show the help menu and the status panel"""
+    show_help_menu(ctx['admin'])
+    console.print("\n" + "─" * 80)
+    console.print(create_status_panel(ctx['user'], ctx['stocks_by_sym']))
+
+def handle_prices(ctx, parts):
+    """Show live prices, or the detail view for one symbol"""
+    stocks = ctx['stocks']
+    if len(parts) == 2:
+        show_enhanced_prices(stocks, parts[1])
+    else:
+        show_enhanced_prices(stocks)
+
+def handle_top10(ctx, parts):
+    """Show the day's top gainers and losers"""
+    show_top10(ctx['stocks'])
+
+def handle_details(ctx, parts):
+    """Show quote details for a symbol; 'full' adds P/E and dividend yield"""
+    full = parts[2:] == ['full']
+    if len(parts) != 2 and not full:
+        console.print(Panel(
+            f"❌ Incomplete command: 'details' requires a stock symbol\n"
+            f"💡 Usage: details <symbol> \\[full] (e.g., details RELIANCE)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+
+    try:
+        # fast_info needs only a quote and price history; the full info
+        # blob (for P/E and dividend yield) is fetched only on request.
+        # A fresh Ticker is used because fast_info caches its values on the
+        # Ticker, which would freeze them for the session if memoized
+        ticker = yf.Ticker(to_ticker(parts[1]))
+        fi = ticker.fast_info
+        current_price = fast_info_value(fi, 'last_price')
+
+        if current_price is None:
+            console.print(f"[red]No data available for {parts[1]}.[/red]")
+            return
+
+        table = Table(title=f"Stock Details for {parts[1]}", style="bold magenta", expand=True)
+        table.add_column("Attribute", style="cyan")
+        table.add_column("Value", style="green")
+
+        # Basic price data and 52-week range
+        for label, name in (("Current Price", 'last_price'), ("Open", 'open'),
+                            ("Previous Close", 'previous_close'),
+                            ("52-Week High", 'year_high'), ("52-Week Low", 'year_low')):
+            value = fast_info_value(fi, name)
+            table.add_row(label, UNIT_PRICE_FMT(value) if value is not None else "N/A")
+
+        # Volume and market data
+        volume = fast_info_value(fi, 'last_volume')
+        avg_volume = fast_info_value(fi, 'three_month_average_volume')
+        market_cap = fast_info_value(fi, 'market_cap')
+        table.add_row("Volume", f"{volume:,.0f}" if volume else "N/A")
+        table.add_row("Average Volume", f"{avg_volume:,.0f}" if avg_volume else "N/A")
+        table.add_row("Market Cap", f"₹{market_cap:,.0f}" if market_cap else "N/A")
+        if full:
+            info = ticker.info
+            table.add_row("P/E Ratio", f"{info['trailingPE']:.2f}" if info.get('trailingPE') else "N/A")
+            table.add_row("Dividend Yield", f"{info['dividendYield']*100:.2f}%" if info.get('dividendYield') else "N/A")
+
+        console.print(Panel(table, title="Stock Overview", border_style="bright_blue"))
+        if not full:
+            console.print(f"[dim]💡 Use 'details {parts[1].lower()} full' for P/E ratio and dividend yield[/dim]")
+
+    except Exception as e:
+        console.print(f"[red]Error fetching details for {parts[1]}: {e}[/red]")
+
+def handle_graph(ctx, parts):
+    """Chart a symbol with SMA analysis, optionally saving a PNG"""
+    if len(parts) < 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'graph' requires a stock symbol\n"
+            f"💡 Usage: graph <symbol> \\[period] \\[png] (e.g., graph RELIANCE 3mo png)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    args = [a for a in parts[2:] if a != 'png']
+    period = args[0] if args else "3mo"
+    show_ultimate_graph(parts[1], period, save_png='png' in parts[2:])
+
+def handle_buy(ctx, parts):
+    """Market buy after confirmation"""
+    user = ctx['user']
+    stocks = ctx['stocks']
+    stocks_by_sym = ctx['stocks_by_sym']
+    tracked_symbols = ctx['tracked_symbols']
+    if len(parts) != 3:
+        console.print(Panel(
+            f"❌ Incomplete command: 'buy' requires stock symbol and number of shares\n"
+            f"💡 Usage: buy <symbol> <shares> (e.g., buy RELIANCE 10)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    # Traditional market buy (existing functionality)
+    stock = get_price(parts[1], stocks_by_sym)
+    if not stock:
+        console.print("[red]Stock data unavailable.[/red]")
+        return
+    if parts[1] not in stocks_by_sym:
+        stocks.append(stock)
+        stocks_by_sym[parts[1]] = stock
+        tracked_symbols.add(to_ticker(parts[1]))
+    try:
+        shares = int(parts[2])
+        if shares <= 0:
+            raise ValueError
+    except ValueError:
+        console.print("[red]Invalid number of shares.[/red]")
+        return
+    current_price = stock['price']
+    cost = current_price * shares
+    if user['balance'] < cost:
+        console.print("[red]Insufficient balance.[/red]")
+        return
+    console.print(Panel(f"[yellow]Current price for {parts[1]}: ₹{current_price:.2f}[/yellow]", border_style="yellow"))
+    cmd_confirm = console.input(f"[bold]Confirm buy {shares} of {parts[1]} at ₹{current_price:.2f} each? (yes/no): [/bold]").strip().lower()
+    if cmd_confirm != 'yes':
+        console.print("[yellow]Transaction cancelled.[/yellow]")
+        return
+    user['balance'] -= cost
+    sym = parts[1]
+    add_to_position(user['portfolio'], sym, shares, current_price)
+    invalidate_net_worth(user)
+    console.print(Panel(f"[green]✅ Bought {shares} shares of {sym} for ₹{cost:.2f}.[/green]", border_style="green"))
+
+def handle_limitbuy(ctx, parts):
+    """Place a limit buy order"""
+    user = ctx['user']
+    username = ctx['username']
+    pending_orders = ctx['pending_orders']
+    if len(parts) != 4:
+        console.print(Panel(
+            f"❌ Incomplete command: 'limitbuy' requires stock symbol, shares, and target price\n"
+            f"💡 Usage: limitbuy <symbol> <shares> <price> (e.g., limitbuy RELIANCE 10 2500)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    try:
+        shares = int(parts[2])
+        target_price = float(parts[3])
+        if shares <= 0 or target_price <= 0:
+            raise ValueError
+
+        # Check if user has enough balance
+        estimated_cost = target_price * shares
+        if user['balance'] < estimated_cost:
+            console.print(f"[red]❌ Insufficient balance. Need ₹{estimated_cost:.2f} but have ₹{user['balance']:.2f}[/red]")
+            return
+
+        order_id = place_limit_order(pending_orders, username, parts[1], shares, target_price, 'buy')
+
+    except ValueError:
+        console.print("[red]❌ Invalid shares or price.[/red]")
+
+def handle_sell(ctx, parts):
+    """Market sell after confirmation"""
+    user = ctx['user']
+    stocks_by_sym = ctx['stocks_by_sym']
+    if len(parts) != 3:
+        console.print(Panel(
+            f"❌ Incomplete command: 'sell' requires stock symbol and number of shares\n"
+            f"💡 Usage: sell <symbol> <shares> (e.g., sell RELIANCE 10)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    sym = parts[1]
+    portfolio = user['portfolio']
+    position = portfolio.get(sym)
+    if position is None:
+        console.print("[red]❌ You don't own this stock.[/red]")
+        return
+    stock = get_price(sym, stocks_by_sym)
+    if not stock:
+        return
+    try:
+        shares = int(parts[2])
+        if shares <= 0 or shares > position['shares']:
+            raise ValueError
+    except ValueError:
+        console.print("[red]❌ Invalid number of shares.[/red]")
+        return
+    current_price = stock['price']
+    revenue = current_price * shares
+    console.print(Panel(f"[yellow]Current price for {sym}: ₹{current_price:.2f}[/yellow]", border_style="yellow"))
+    cmd_confirm = console.input(f"[bold]Confirm sell {shares} of {sym} at ₹{current_price:.2f} each? (yes/no): [/bold]").strip().lower()
+    if cmd_confirm != 'yes':
+        console.print("[yellow]Transaction cancelled.[/yellow]")
+        return
+    user['balance'] += revenue
+    position['shares'] -= shares
+    if position['shares'] == 0:
+        del portfolio[sym]
+    invalidate_net_worth(user)
+    console.print(Panel(f"[green]✅ Sold {shares} shares of {sym} for ₹{revenue:.2f}.[/green]", border_style="green"))
+
+def handle_limitsell(ctx, parts):
+    """Place a limit sell order"""
+    user = ctx['user']
+    username = ctx['username']
+    pending_orders = ctx['pending_orders']
+    if len(parts) != 4:
+        console.print(Panel(
+            f"❌ Incomplete command: 'limitsell' requires stock symbol, shares, and target price\n"
+            f"💡 Usage: limitsell <symbol> <shares> <price> (e.g., limitsell RELIANCE 10 2600)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    try:
+        sym = parts[1]
+        shares = int(parts[2])
+        target_price = float(parts[3])
+
+        if shares <= 0 or target_price <= 0:
+            raise ValueError
+
+        # Check if user owns enough shares
+        position = user['portfolio'].get(sym)
+        available = position['shares'] if position else 0
+        if available < shares:
+            console.print(f"[red]❌ Insufficient shares. You have {available} shares of {sym}[/red]")
+            return
+
+        order_id = place_limit_order(pending_orders, username, sym, shares, target_price, 'sell')
+
+    except ValueError:
+        console.print("[red]❌ Invalid shares or price.[/red]")
+
+def handle_sellpct(ctx, parts):
+    """Sell a percentage of a holding"""
+    user = ctx['user']
+    stocks_by_sym = ctx['stocks_by_sym']
+    if len(parts) != 3:
+        console.print(Panel(
+            f"❌ Incomplete command: 'sellpct' requires stock symbol and percentage\n"
+            f"💡 Usage: sellpct <symbol> <percentage> (e.g., sellpct RELIANCE 50)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    try:
+        sym = parts[1]
+        percentage = float(parts[2])
+
+        sell_percentage(user, sym, percentage, stocks_by_sym)
+
+    except ValueError:
+        console.print("[red]❌ Invalid percentage.[/red]")
+
+def handle_sellanalysis(ctx, parts):
+    """Show the sell analysis and recommendations for a holding"""
+    user = ctx['user']
+    stocks_by_sym = ctx['stocks_by_sym']
+    if len(parts) != 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'sellanalysis' requires a stock symbol\n"
+            f"💡 Usage: sellanalysis <symbol> (e.g., sellanalysis RELIANCE)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    sym = parts[1]
+    analysis = advanced_sell_analysis(user, sym, stocks_by_sym)
+
+    if analysis:
+        # Display comprehensive sell analysis
+        analysis_table = build_sell_analysis_table()
+        analysis_table.title = f"🎯 Advanced Sell Analysis for {sym}"
+
+        pl_pct = analysis['profit_loss_pct']
+        pl_pct_fmt = (GAIN_PL_FMTS if pl_pct > 0 else LOSS_PL_FMTS)[1]
+        for row in (("💰 Current Price", UNIT_PRICE_FMT(analysis['current_price']), "Live market price"),
+                    ("💵 Your Avg Cost", UNIT_PRICE_FMT(analysis['avg_cost']), "Your purchase average"),
+                    ("📊 P/L %", pl_pct_fmt(pl_pct), "Your profit/loss"),
+                    ("📈 SMA 20", UNIT_PRICE_FMT(analysis['sma_20']), "20-day moving average"),
+                    ("📊 SMA 50", UNIT_PRICE_FMT(analysis['sma_50']), "50-day moving average")):
+            analysis_table.add_row(*row)
+
+        console.print(Panel(analysis_table, border_style="cyan"))
+
+        if analysis['recommendations']:
+            rec_panel = "\n".join(map("• {}".format, analysis['recommendations']))
+            console.print(Panel(rec_panel, title="💡 Selling Recommendations", border_style="yellow"))
+        else:
+            console.print(Panel("📊 No specific recommendations at this time. Monitor market conditions.", 
+                                title="💡 Analysis", border_style="blue"))
+    else:
+        console.print("[red]❌ Unable to analyze this stock. Make sure you own it and data is available.[/red]")
+
+def handle_stoploss(ctx, parts):
+    """Set a fixed stop-loss"""
+    user = ctx['user']
+    if len(parts) != 4:
+        console.print(Panel(
+            f"❌ Incomplete command: 'stoploss' requires stock symbol, shares, and stop price\n"
+            f"💡 Usage: stoploss <symbol> <shares> <price> (e.g., stoploss RELIANCE 10 2400)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    try:
+        sym = parts[1]
+        shares = int(parts[2])
+        stop_price = float(parts[3])
+
+        if shares <= 0 or stop_price <= 0:
+            raise ValueError
+
+        set_stop_loss(user, sym, shares, stop_price)
+
+    except ValueError:
+        console.print("[red]❌ Invalid shares or price.[/red]")
+
+def handle_trailstop(ctx, parts):
+    """Set a trailing stop-loss"""
+    user = ctx['user']
+    if len(parts) != 4:
+        console.print(Panel(
+            f"❌ Incomplete command: 'trailstop' requires stock symbol, shares, and trailing percentage\n"
+            f"💡 Usage: trailstop <symbol> <shares> <percent> (e.g., trailstop RELIANCE 10 5)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    try:
+        sym = parts[1]
+        shares = int(parts[2])
+        trailing_percent = float(parts[3])
+
+        if shares <= 0 or trailing_percent <= 0 or trailing_percent >= 100:
+            raise ValueError
+
+        set_stop_loss(user, sym, shares, 0, trailing=True, trailing_percent=trailing_percent)
+
+    except ValueError:
+        console.print("[red]❌ Invalid shares or percentage (must be 0-100).[/red]")
+
+def handle_orders(ctx, parts):
+    """Show pending stop-loss and limit orders"""
+    show_orders_status(ctx['user'], ctx['pending_orders'], ctx['username'])
+
+def handle_cancel(ctx, parts):
+    """Cancel a stop-loss or limit order"""
+    user = ctx['user']
+    username = ctx['username']
+    pending_orders = ctx['pending_orders']
+    if len(parts) < 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'cancel' requires an order type\n"
+            f"💡 Usage: cancel <stoploss|limit> \\[symbol] (e.g., cancel stoploss RELIANCE)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    order_type = parts[1]
+    symbol = sys.intern(parts[2].upper()) if len(parts) > 2 else None
+    cancel_order(user, pending_orders, username, order_type, symbol)
+
+def handle_portfolio(ctx, parts):
+    """Show the portfolio breakdown"""
+    show_enhanced_portfolio(ctx['user'], ctx['stocks_by_sym'])
+
+def handle_leaderboard(ctx, parts):
+    """Record the user's net worth and show the top traders"""
+    user = ctx['user']
+    username = ctx['username']
+    stocks_by_sym = ctx['stocks_by_sym']
+    leaderboard = ctx['leaderboard']
+    set_leaderboard_score(leaderboard, username, calculate_net_worth(user, stocks_by_sym))
+
+    table = build_leaderboard_table()
+
+    for rank, (trader, score) in enumerate(leaderboard_top(leaderboard), 1):
+        status = "👑" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else "⭐"
+        if trader == username:
+            trader = f"[bold]{trader} (You)[/bold]"
+        table.add_row(str(rank), trader, PRICE_FMT(score), status)
+
+    console.print(Panel(table, title="🏆 Elite Traders", border_style="bright_blue"))
+
+def handle_refresh(ctx, parts):
+    """Re-download market data"""
+    enhanced_loading_animation("Refreshing market data...", 1.0)
+    new_stocks = fetch_prices()
+    if new_stocks:
+        ctx['stocks'] = new_stocks
+        ctx['stocks_by_sym'] = index_stocks(new_stocks)
+        console.print("[green]✅ Market data refreshed![/green]")
+    else:
+        console.print("[yellow]⚠️  Failed to refresh market data.[/yellow]")
+
+def handle_listusers(ctx, parts):
+    """List all registered users"""
+    list_all_users(ctx['users'])
+
+def handle_userinfo(ctx, parts):
+    """Show one user's account details"""
+    users = ctx['users']
+    if len(parts) != 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'userinfo' requires a username\n"
+            f"💡 Usage: userinfo <username> (e.g., userinfo john)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    get_user_info(users, parts[1])
+
+def handle_resetuser(ctx, parts):
+    """Reset a user to the starting balance"""
+    users = ctx['users']
+    if len(parts) != 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'resetuser' requires a username\n"
+            f"💡 Usage: resetuser <username> (e.g., resetuser john)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    target_user = parts[1]
+    if target_user in users:
+        confirm = console.input(f"[bold red]⚠️  Reset user '{target_user}' to default state? (yes/no): [/bold red]").strip().lower()
+        if confirm == 'yes':
+            invalidate_net_worth(users[target_user])
+            users[target_user] = {'balance': 10000.0, 'portfolio': {}, 'stop_losses': {}}
+            console.print(Panel(f"✅ User '{target_user}' has been reset to default state.", 
+                              title="🔄 User Reset", border_style="green"))
+        else:
+            console.print("[yellow]Reset cancelled.[/yellow]")
+    else:
+        console.print(f"[red]❌ User '{target_user}' not found.[/red]")
+
+def handle_deleteuser(ctx, parts):
+    """Delete a user and their leaderboard entry"""
+    users = ctx['users']
+    username = ctx['username']
+    leaderboard = ctx['leaderboard']
+    if len(parts) != 2:
+        console.print(Panel(
+            f"❌ Incomplete command: 'deleteuser' requires a username\n"
+            f"💡 Usage: deleteuser <username> (e.g., deleteuser john)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    target_user = parts[1]
+    if target_user in users:
+        if target_user == username:
+            console.print("[red]❌ You cannot delete yourself![/red]")
+        else:
+            confirm = console.input(f"[bold red]⚠️  PERMANENTLY DELETE user '{target_user}'? (yes/no): [/bold red]").strip().lower()
+            if confirm == 'yes':
+                invalidate_net_worth(users[target_user])
+                del users[target_user]
+                # Also remove from leaderboard
+                remove_leaderboard_entry(leaderboard, target_user)
+                console.print(Panel(f"🗑️  User '{target_user}' has been permanently deleted.", 
+                                  title="❌ User Deleted", border_style="red"))
+            else:
+                console.print("[yellow]Delete cancelled.[/yellow]")
+    else:
+        console.print(f"[red]❌ User '{target_user}' not found.[/red]")
+
+def handle_setbalance(ctx, parts):
+    """Set a user's cash balance"""
+    users = ctx['users']
+    if len(parts) != 3:
+        console.print(Panel(
+            f"❌ Incomplete command: 'setbalance' requires username and amount\n"
+            f"💡 Usage: setbalance <username> <amount> (e.g., setbalance john 15000)",
+            title="⚠️ Command Help", border_style="yellow"))
+        return
+    target_user = parts[1]
+    try:
+        new_balance = float(parts[2])
+        if target_user in users:
+            old_balance = users[target_user].get('balance', 0)
+            users[target_user]['balance'] = new_balance
+            console.print(Panel(
+                f"💰 Balance updated for '{target_user}'\n"
+                f"Old Balance: ₹{old_balance:,.2f}\n"
+                f"New Balance: ₹{new_balance:,.2f}",
+                title="💳 Balance Update", border_style="green"))
+        else:
+            console.print(f"[red]❌ User '{target_user}' not found.[/red]")
+    except ValueError:
+        console.print("[red]❌ Invalid balance amount.[/red]")
+
+def handle_backup(ctx, parts):
+    """Write a timestamped copy of the user data"""
+    users = ctx['users']
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_file = f"backup_users_{timestamp}.json"
+    try:
+        with open(backup_file, 'wb') as f:
+            f.write(json_dumps(users))
+        console.print(Panel(f"✅ User data backed up to: {backup_file}", 
+                          title="💾 Backup Created", border_style="green"))
+    except Exception as e:
+        console.print(f"[red]❌ Backup failed: {e}[/red]")
+
+def handle_stats(ctx, parts):
+    """Show system-wide statistics"""
+    system_stats(ctx['users'], ctx['pending_orders'])
+
+def handle_clearorders(ctx, parts):
+    """Clear every pending limit order"""
+    pending_orders = ctx['pending_orders']
+    order_count = len(pending_orders)
+    if order_count > 0:
+        confirm = console.input(f"[bold red]⚠️  Clear {order_count} pending orders? (yes/no): [/bold red]").strip().lower()
+        if confirm == 'yes':
+            clear_orders(pending_orders)
+            console.print(Panel(f"🧹 Cleared {order_count} pending orders.", 
+                              title="📋 Orders Cleared", border_style="yellow"))
+        else:
+            console.print("[yellow]Clear cancelled.[/yellow]")
+    else:
+        console.print("[yellow]No pending orders to clear.[/yellow]")
+
+def handle_quit(ctx, parts):
+    """Leave the trading session; returning True ends the command loop"""
+    session = "admin" if ctx['admin'] else "trading"
+    console.print(f"[bold]💾 Saving {session} session...[/bold]")
+    enhanced_loading_animation("Saving data...", 0.5)
+    return True
+
+# Command tables: name -> handler(ctx, parts); a truthy return ends the session
+COMMANDS = {
+    'help': handle_help, 'prices': handle_prices, 'top10': handle_top10, 'details': handle_details,
+    'graph': handle_graph, 'buy': handle_buy, 'limitbuy': handle_limitbuy, 'sell': handle_sell,
+    'limitsell': handle_limitsell, 'sellpct': handle_sellpct, 'sellanalysis': handle_sellanalysis,
+    'stoploss': handle_stoploss, 'trailstop': handle_trailstop, 'orders': handle_orders,
+    'cancel': handle_cancel, 'portfolio': handle_portfolio, 'leaderboard': handle_leaderboard,
+    'refresh': handle_refresh, 'quit': handle_quit,
+}
+ADMIN_COMMANDS = {
+    'listusers': handle_listusers, 'userinfo': handle_userinfo, 'resetuser': handle_resetuser,
+    'deleteuser': handle_deleteuser, 'setbalance': handle_setbalance, 'backup': handle_backup,
+    'stats': handle_stats, 'clearorders': handle_clearorders,
+}
+# Sorted names for prefix lookups in suggest_command
+COMMAND_NAMES = sorted(COMMANDS)
+ALL_COMMAND_NAMES = sorted([*COMMANDS, *ADMIN_COMMANDS])
+
+def suggest_command(name, admin):
+    """Point an unknown command at the known commands it is a prefix of"""
+    known_commands = ALL_COMMAND_NAMES if admin else COMMAND_NAMES
+    partial_matches = []
+    for cmd in itertools.islice(known_commands, bisect.bisect_left(known_commands, name), None):
+        if not cmd.startswith(name):
+            break
+        partial_matches.append(cmd)
+    
+    if partial_matches:
+        suggestions = ', '.join(partial_matches)
+        console.print(Panel(
+            f"❓ Did you mean: {suggestions}?\n"
+            f"💡 Type [cyan]help[/cyan] to see all available commands.",
+            title="🤔 Possible Command", border_style="yellow"))
+    else:
+        console.print(Panel(
+            f"❌ Unknown command: '{name}'\n"
+            f"💡 Type [cyan]help[/cyan] to see all available commands.",
+            title="⚠️  Command Error", border_style="red"))
+
+def run_order_checks(ctx):
+    """Execute any stop-loss and limit orders the current quotes trigger and log the accounts they change"""
+    user, users, stocks_by_sym = ctx['user'], ctx['users'], ctx['stocks_by_sym']
+    
+    # Quote everything both order checks need in one batched download
+    prefetch_order_prices(user, stocks_by_sym)
+    
+    # Check and execute stop losses
+    _, stops_changed = check_stop_losses(user, stocks_by_sym)
+    
+    # Process limit orders
+    executed_limit_orders = process_limit_orders(ctx['pending_orders'], stocks_by_sym, users)
+    if stops_changed:
+        log_user(users, ctx['username'])
+    for order_user in {order['user'] for order in executed_limit_orders}:
+        log_user(users, order_user)
+
+async def price_poller(ctx):
+    """Refresh market data and run the order checks periodically, so triggers fire while the prompt is idle"""
+    while True:
+        await asyncio.sleep(PRICE_POLL_SECONDS)
+        try:
+            new_stocks = await asyncio.to_thread(fetch_prices)
+            if new_stocks:
+                ctx['stocks'] = new_stocks
+                ctx['stocks_by_sym'] = index_stocks(new_stocks)
+            run_order_checks(ctx)
+        except Exception as e:
+            # Keep polling; one bad refresh should not stop the triggers for the session
+            console.print(f"[yellow]Warning: Background price refresh failed: {e}[/yellow]")
+
+async def read_command(prompt):
+    """Read a line on a daemon thread; asyncio's default executor would be waited on at shutdown"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    
+    def deliver(set_outcome, value):
+        if not future.done():
+            set_outcome(value)
+    
+    def read():
+        try:
+            outcome = (future.set_result, console.input(prompt))
+        except BaseException as e:
+            outcome = (future.set_exception, e)
+        try:
+            loop.call_soon_threadsafe(deliver, *outcome)
+        except RuntimeError:
+            pass  # the session already ended
+    
+    threading.Thread(target=read, name="prompt", daemon=True).start()
+    return await future
+
+async def run_session(ctx):
+    """Command loop; input is read on a worker thread so the price poller keeps running"""
+    users, username, admin = ctx['users'], ctx['username'], ctx['admin']
+    poller = asyncio.create_task(price_poller(ctx))
+    try:
+        while True:
+            run_order_checks(ctx)
+            
+            cmd = await read_command("\n🎯 [bold]ultimate-trader>[/bold] ")
+            parts = cmd.strip().lower().split()
+            
+            if not parts:
+                continue
+            
+            # Canonicalize the symbol argument once for commands that take one
+            if len(parts) > 1 and parts[0] in SYMBOL_COMMANDS:
+                parts[1] = sys.intern(parts[1].upper())
+            
+            handler = COMMANDS.get(parts[0]) or (admin and ADMIN_COMMANDS.get(parts[0]))
+            if not handler:
+                suggest_command(parts[0], admin)
+                continue
+            if handler(ctx, parts):
+                break
+            
+            # Save only what the command changed
+            if parts[0] in USER_DATA_COMMANDS:
+                log_user(users, username)
+            elif parts[0] in TARGET_USER_COMMANDS and len(parts) > 1:
+                log_user(users, parts[1])
+            if parts[0] in LEADERBOARD_COMMANDS:
+                mark_dirty(LEADERBOARD_FILE, ctx['leaderboard'])
+            maybe_compact_orders(ctx['pending_orders'])
+            maybe_compact_users(users)
+    finally:
+        poller.cancel()
+
 def main():
     console.clear()
     console.print(Panel(ASCII_LOGO, title="🚀 Ultimate Stock Trader Pro", style="bold cyan", padding=(1, 2)))
     
     # Load data
-    users = load_data(USERS_FILE, {})
+    users = load_users()
     leaderboard = load_data(LEADERBOARD_FILE, {})
-    pending_orders = load_data(ORDERS_FILE, {})
+    pending_orders = load_orders()
     stocks = []
-    tracked_symbols = SYMBOLS.copy()
+    tracked_symbols = set(SYMBOLS_FULL)
     
     # User authentication
     console.print("\n🎯 [bold]Enter your trading credentials:[/bold]")
@@ -1240,528 +2580,42 @@ def main():
     if username not in users:
         users[username] = {'balance': 10000.0, 'portfolio': {}, 'stop_losses': {}}
         console.print("🎉 [green]Welcome! New trader account created with ₹10,000 starting capital![/green]")
+        log_user(users, username)
     
     user = users[username]
+    admin = is_admin(username)
     console.print(f"👋 [bold]Welcome back, {username}![/bold]")
     
     # Load market data
     enhanced_loading_animation("Connecting to live markets...", 1.5)
     stocks = fetch_prices()
+    stocks_by_sym = index_stocks(stocks)
     if not stocks:
         console.print("⚠️  [yellow]Live market data unavailable. Some features may be limited.[/yellow]")
     
     # Show initial status
     console.print(Rule(f"🎯 ULTIMATE TRADER - {username}", style="bold green"))
-    console.print(create_status_panel(user, stocks))
+    console.print(create_status_panel(user, stocks_by_sym))
     console.print("\n💡 [dim]Type [bold cyan]help[/bold cyan] to see all available commands[/dim]")
     
-    while True:
-        # Check and execute stop losses
-        executed_stop_losses = check_stop_losses(user, stocks)
-    
-        # Process limit orders
-        executed_limit_orders = process_limit_orders(pending_orders, stocks, users)
-    
-        cmd = console.input("\n🎯 [bold]ultimate-trader>[/bold] ").strip().lower()
-        parts = cmd.split()
+    ctx = {'user': user, 'users': users, 'username': username, 'admin': admin,
+           'stocks': stocks, 'stocks_by_sym': stocks_by_sym, 'tracked_symbols': tracked_symbols,
+           'pending_orders': pending_orders, 'leaderboard': leaderboard}
     
-        if not parts:
-            continue
-    
-        # Flag to track if we should show status after command
-        show_status = False
-    
-        # Help Command
-        if parts[0] == 'help':
-            show_help_menu(username)
-            show_status = True
-    
-        # Market Data Commands
-        elif parts[0] == 'prices':
-            if len(parts) == 2:
-                show_enhanced_prices(stocks, parts[1].upper())
-            else:
-                show_enhanced_prices(stocks)
-    
-        elif parts[0] == 'top10':
-            show_top10(stocks)
-    
-        elif parts[0] == 'details':
-            if len(parts) != 2:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'details' requires a stock symbol\n"
-                    f"💡 Usage: details <symbol> (e.g., details RELIANCE)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-
-            # Using the original show_stock_details function
-            try:
-                ticker = yf.Ticker(f"{parts[1].upper()}.NS")
-                info = ticker.info
-                hist = ticker.history(period="1y")
-
-                if not info or hist.empty:
-                    console.print(f"[red]No data available for {parts[1].upper()}.[/red]")
-                    continue
-
-                table = Table(title=f"Stock Details for {parts[1].upper()}", style="bold magenta", expand=True)
-                table.add_column("Attribute", style="cyan")
-                table.add_column("Value", style="green")
-
-                # Basic price data
-                table.add_row("Current Price", f"₹{info.get('currentPrice', 'N/A'):.2f}")
-                table.add_row("Open", f"₹{info.get('open', 'N/A'):.2f}")
-                table.add_row("Previous Close", f"₹{info.get('previousClose', 'N/A'):.2f}")
-
-                # 52-week range
-                if not hist.empty:
-                    high_52w = hist['High'].max()
-                    low_52w = hist['Low'].min()
-                    table.add_row("52-Week High", f"₹{high_52w:.2f}")
-                    table.add_row("52-Week Low", f"₹{low_52w:.2f}")
-                else:
-                    table.add_row("52-Week High", "N/A")
-                    table.add_row("52-Week Low", "N/A")
-
-                # Volume and market data
-                table.add_row("Volume", f"{info.get('volume', 'N/A'):,}" if info.get('volume') else "N/A")
-                table.add_row("Average Volume", f"{info.get('averageVolume', 'N/A'):,}" if info.get('averageVolume') else "N/A")
-                table.add_row("Market Cap", f"₹{info.get('marketCap', 'N/A'):,}" if info.get('marketCap') else "N/A")
-                table.add_row("P/E Ratio", f"{info.get('trailingPE', 'N/A'):.2f}" if info.get('trailingPE') else "N/A")
-                table.add_row("Dividend Yield", f"{info.get('dividendYield', 'N/A')*100:.2f}%" if info.get('dividendYield') else "N/A")
-
-                console.print(Panel(table, title="Stock Overview", border_style="bright_blue"))
-
-            except Exception as e:
-                console.print(f"[red]Error fetching details for {parts[1].upper()}: {e}[/red]")
-        
-        elif parts[0] == 'graph':
-            if len(parts) < 2:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'graph' requires a stock symbol\n"
-                    f"💡 Usage: graph <symbol> [period] (e.g., graph RELIANCE 3mo)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            period = parts[2] if len(parts) > 2 else "3mo"
-            show_ultimate_graph(parts[1].upper(), period)
-        
-        # Trading Commands
-        elif parts[0] == 'buy':
-            if len(parts) != 3:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'buy' requires stock symbol and number of shares\n"
-                    f"💡 Usage: buy <symbol> <shares> (e.g., buy RELIANCE 10)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            # Traditional market buy (existing functionality)
-            stock = next((s for s in stocks if s['symbol'] == parts[1].upper()), None)
-            if not stock:
-                stock = fetch_single_price(parts[1].upper())
-                if stock:
-                    stocks.append(stock)
-                    if f"{parts[1].upper()}.NS" not in tracked_symbols:
-                        tracked_symbols.append(f"{parts[1].upper()}.NS")
-                else:
-                    console.print("[red]Stock data unavailable.[/red]")
-                    continue
-            try:
-                shares = int(parts[2])
-                if shares <= 0:
-                    raise ValueError
-            except ValueError:
-                console.print("[red]Invalid number of shares.[/red]")
-                continue
-            current_price = stock['price']
-            cost = current_price * shares
-            if user['balance'] < cost:
-                console.print("[red]Insufficient balance.[/red]")
-                continue
-            console.print(Panel(f"[yellow]Current price for {parts[1].upper()}: ₹{current_price:.2f}[/yellow]", border_style="yellow"))
-            cmd_confirm = console.input(f"[bold]Confirm buy {shares} of {parts[1].upper()} at ₹{current_price:.2f} each? (yes/no): [/bold]").strip().lower()
-            if cmd_confirm != 'yes':
-                console.print("[yellow]Transaction cancelled.[/yellow]")
-                continue
-            user['balance'] -= cost
-            sym = parts[1].upper()
-            if sym not in user['portfolio']:
-                user['portfolio'][sym] = {'shares': shares, 'avg_cost': current_price}
-            else:
-                old_data = user['portfolio'][sym]
-                old_shares = old_data['shares']
-                old_avg = old_data['avg_cost']
-                new_shares = old_shares + shares
-                new_avg = (old_avg * old_shares + current_price * shares) / new_shares
-                user['portfolio'][sym] = {'shares': new_shares, 'avg_cost': new_avg}
-            console.print(Panel(f"[green]✅ Bought {shares} shares of {sym} for ₹{cost:.2f}.[/green]", border_style="green"))
-        
-        elif parts[0] == 'limitbuy':
-            if len(parts) != 4:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'limitbuy' requires stock symbol, shares, and target price\n"
-                    f"💡 Usage: limitbuy <symbol> <shares> <price> (e.g., limitbuy RELIANCE 10 2500)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            try:
-                shares = int(parts[2])
-                target_price = float(parts[3])
-                if shares <= 0 or target_price <= 0:
-                    raise ValueError
-                
-                # Check if user has enough balance
-                estimated_cost = target_price * shares
-                if user['balance'] < estimated_cost:
-                    console.print(f"[red]❌ Insufficient balance. Need ₹{estimated_cost:.2f} but have ₹{user['balance']:.2f}[/red]")
-                    continue
-                
-                order_id = place_limit_order(pending_orders, username, parts[1].upper(), shares, target_price, 'buy')
-                
-            except ValueError:
-                console.print("[red]❌ Invalid shares or price.[/red]")
-        
-        elif parts[0] == 'sell':
-            if len(parts) != 3:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'sell' requires stock symbol and number of shares\n"
-                    f"💡 Usage: sell <symbol> <shares> (e.g., sell RELIANCE 10)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            sym = parts[1].upper()
-            if sym not in user['portfolio']:
-                console.print("[red]❌ You don't own this stock.[/red]")
-                continue
-            stock = next((s for s in stocks if s['symbol'] == sym), None)
-            if not stock:
-                stock = fetch_single_price(sym)
-                if not stock:
-                    continue
-            try:
-                shares = int(parts[2])
-                if shares <= 0 or shares > user['portfolio'][sym]['shares']:
-                    raise ValueError
-            except ValueError:
-                console.print("[red]❌ Invalid number of shares.[/red]")
-                continue
-            current_price = stock['price']
-            revenue = current_price * shares
-            console.print(Panel(f"[yellow]Current price for {sym}: ₹{current_price:.2f}[/yellow]", border_style="yellow"))
-            cmd_confirm = console.input(f"[bold]Confirm sell {shares} of {sym} at ₹{current_price:.2f} each? (yes/no): [/bold]").strip().lower()
-            if cmd_confirm != 'yes':
-                console.print("[yellow]Transaction cancelled.[/yellow]")
-                continue
-            user['balance'] += revenue
-            user['portfolio'][sym]['shares'] -= shares
-            if user['portfolio'][sym]['shares'] == 0:
-                del user['portfolio'][sym]
-            console.print(Panel(f"[green]✅ Sold {shares} shares of {sym} for ₹{revenue:.2f}.[/green]", border_style="green"))
-        
-        elif parts[0] == 'limitsell':
-            if len(parts) != 4:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'limitsell' requires stock symbol, shares, and target price\n"
-                    f"💡 Usage: limitsell <symbol> <shares> <price> (e.g., limitsell RELIANCE 10 2600)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            try:
-                sym = parts[1].upper()
-                shares = int(parts[2])
-                target_price = float(parts[3])
-                
-                if shares <= 0 or target_price <= 0:
-                    raise ValueError
-                
-                # Check if user owns enough shares
-                if sym not in user['portfolio'] or user['portfolio'][sym]['shares'] < shares:
-                    available = user['portfolio'].get(sym, {}).get('shares', 0)
-                    console.print(f"[red]❌ Insufficient shares. You have {available} shares of {sym}[/red]")
-                    continue
-                
-                order_id = place_limit_order(pending_orders, username, sym, shares, target_price, 'sell')
-                
-            except ValueError:
-                console.print("[red]❌ Invalid shares or price.[/red]")
-        
-        elif parts[0] == 'sellpct':
-            if len(parts) != 3:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'sellpct' requires stock symbol and percentage\n"
-                    f"💡 Usage: sellpct <symbol> <percentage> (e.g., sellpct RELIANCE 50)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            try:
-                sym = parts[1].upper()
-                percentage = float(parts[2])
-                
-                sell_percentage(user, sym, percentage, stocks)
-                
-            except ValueError:
-                console.print("[red]❌ Invalid percentage.[/red]")
-        
-        elif parts[0] == 'sellanalysis':
-            if len(parts) != 2:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'sellanalysis' requires a stock symbol\n"
-                    f"💡 Usage: sellanalysis <symbol> (e.g., sellanalysis RELIANCE)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            sym = parts[1].upper()
-            analysis = advanced_sell_analysis(user, sym, stocks)
-            
-            if analysis:
-                # Display comprehensive sell analysis
-                analysis_table = Table(title=f"🎯 Advanced Sell Analysis for {sym}", style="bold cyan")
-                analysis_table.add_column("Metric", style="white", width=20)
-                analysis_table.add_column("Value", style="green", width=15)
-                analysis_table.add_column("Assessment", style="yellow", width=25)
-                
-                profit_color = "bright_green" if analysis['profit_loss_pct'] > 0 else "bright_red"
-                analysis_table.add_row("💰 Current Price", f"₹{analysis['current_price']:.2f}", "Live market price")
-                analysis_table.add_row("💵 Your Avg Cost", f"₹{analysis['avg_cost']:.2f}", "Your purchase average")
-                analysis_table.add_row("📊 P/L %", f"[{profit_color}]{analysis['profit_loss_pct']:+.1f}%[/{profit_color}]", "Your profit/loss")
-                analysis_table.add_row("📈 SMA 20", f"₹{analysis['sma_20']:.2f}", "20-day moving average")
-                analysis_table.add_row("📊 SMA 50", f"₹{analysis['sma_50']:.2f}", "50-day moving average")
-                
-                console.print(Panel(analysis_table, border_style="cyan"))
-                
-                if analysis['recommendations']:
-                    rec_panel = "\n".join([f"• {rec}" for rec in analysis['recommendations']])
-                    console.print(Panel(rec_panel, title="💡 Selling Recommendations", border_style="yellow"))
-                else:
-                    console.print(Panel("📊 No specific recommendations at this time. Monitor market conditions.", 
-                                        title="💡 Analysis", border_style="blue"))
-            else:
-                console.print("[red]❌ Unable to analyze this stock. Make sure you own it and data is available.[/red]")
-        
-        # Risk Management Commands
-        elif parts[0] == 'stoploss':
-            if len(parts) != 4:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'stoploss' requires stock symbol, shares, and stop price\n"
-                    f"💡 Usage: stoploss <symbol> <shares> <price> (e.g., stoploss RELIANCE 10 2400)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            try:
-                sym = parts[1].upper()
-                shares = int(parts[2])
-                stop_price = float(parts[3])
-                
-                if shares <= 0 or stop_price <= 0:
-                    raise ValueError
-                    
-                set_stop_loss(user, sym, shares, stop_price)
-                
-            except ValueError:
-                console.print("[red]❌ Invalid shares or price.[/red]")
-        
-        elif parts[0] == 'trailstop':
-            if len(parts) != 4:
-                console.print(Panel(
-                    f"❌ Incomplete command: 'trailstop' requires stock symbol, shares, and trailing percentage\n"
-                    f"💡 Usage: trailstop <symbol> <shares> <percent> (e.g., trailstop RELIANCE 10 5)",
-                    title="⚠️ Command Help", border_style="yellow"))
-                continue
-            try:
-                sym = parts[1].upper()
-                shares = int(parts[2])
-                trailing_percent = float(parts[3])
-                
-                if shares <= 0 or trailing_percent <= 0 or trailing_percent >= 100:
-                    raise ValueError
-                    
-                set_stop_loss(user, sym, shares, 0, trailing=True, trailing_percent=trailing_percent)
-                
-            except ValueError:
-                console.print("[red]❌ Invalid shares or percentage (must be 0-100).[/red]")
-        
-        elif parts[0] == 'orders':
-            show_orders_status(user, pending_orders, username)
-        
-        elif parts[0] == 'cancel' and len(parts) >= 2:
-            order_type = parts[1]
-            symbol = parts[2].upper() if len(parts) > 2 else None
-            cancel_order(user, pending_orders, username, order_type, symbol)
-        
-        # Portfolio & Analysis
-        elif parts[0] == 'portfolio':
-            show_enhanced_portfolio(user, stocks)
-        
-        elif parts[0] == 'leaderboard':
-            current_net_worth = calculate_net_worth(user, stocks)
-            leaderboard[username] = current_net_worth
-            
-            table = Table(title="🏆 Top Traders Leaderboard", style="bold magenta", expand=True)
-            table.add_column("Rank", style="yellow", width=6)
-            table.add_column("Trader", style="cyan", width=15)
-            table.add_column("Net Worth", justify="right", style="green", width=15)
-            table.add_column("Status", justify="center", width=10)
-            
-            sorted_lb = sorted(leaderboard.items(), key=lambda x: x[1], reverse=True)[:10]
-            for rank, (trader, score) in enumerate(sorted_lb, 1):
-                status = "👑" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else "⭐"
-                if trader == username:
-                    trader = f"[bold]{trader} (You)[/bold]"
-                table.add_row(str(rank), trader, f"₹{score:,.2f}", status)
-            
-            console.print(Panel(table, title="🏆 Elite Traders", border_style="bright_blue"))
-        
-        # Utility Commands
-        elif parts[0] == 'refresh':
-            enhanced_loading_animation("Refreshing market data...", 1.0)
-            new_stocks = fetch_prices()
-            if new_stocks:
-                stocks = new_stocks
-                console.print("[green]✅ Market data refreshed![/green]")
-            else:
-                console.print("[yellow]⚠️  Failed to refresh market data.[/yellow]")
-        
-        # Admin Commands (only for admin users)
-        elif is_admin(username):
-            if parts[0] == 'listusers':
-                list_all_users(users)
-            
-            elif parts[0] == 'userinfo':
-                if len(parts) != 2:
-                    console.print(Panel(
-                        f"❌ Incomplete command: 'userinfo' requires a username\n"
-                        f"💡 Usage: userinfo <username> (e.g., userinfo john)",
-                        title="⚠️ Command Help", border_style="yellow"))
-                    continue
-                get_user_info(users, parts[1])
-            
-            elif parts[0] == 'resetuser':
-                if len(parts) != 2:
-                    console.print(Panel(
-                        f"❌ Incomplete command: 'resetuser' requires a username\n"
-                        f"💡 Usage: resetuser <username> (e.g., resetuser john)",
-                        title="⚠️ Command Help", border_style="yellow"))
-                    continue
-                target_user = parts[1]
-                if target_user in users:
-                    confirm = console.input(f"[bold red]⚠️  Reset user '{target_user}' to default state? (yes/no): [/bold red]").strip().lower()
-                    if confirm == 'yes':
-                        users[target_user] = {'balance': 10000.0, 'portfolio': {}, 'stop_losses': {}}
-                        console.print(Panel(f"✅ User '{target_user}' has been reset to default state.", 
-                                          title="🔄 User Reset", border_style="green"))
-                    else:
-                        console.print("[yellow]Reset cancelled.[/yellow]")
-                else:
-                    console.print(f"[red]❌ User '{target_user}' not found.[/red]")
-            
-            elif parts[0] == 'deleteuser':
-                if len(parts) != 2:
-                    console.print(Panel(
-                        f"❌ Incomplete command: 'deleteuser' requires a username\n"
-                        f"💡 Usage: deleteuser <username> (e.g., deleteuser john)",
-                        title="⚠️ Command Help", border_style="yellow"))
-                    continue
-                target_user = parts[1]
-                if target_user in users:
-                    if target_user == username:
-                        console.print("[red]❌ You cannot delete yourself![/red]")
-                    else:
-                        confirm = console.input(f"[bold red]⚠️  PERMANENTLY DELETE user '{target_user}'? (yes/no): [/bold red]").strip().lower()
-                        if confirm == 'yes':
-                            del users[target_user]
-                            # Also remove from leaderboard
-                            if target_user in leaderboard:
-                                del leaderboard[target_user]
-                            console.print(Panel(f"🗑️  User '{target_user}' has been permanently deleted.", 
-                                              title="❌ User Deleted", border_style="red"))
-                        else:
-                            console.print("[yellow]Delete cancelled.[/yellow]")
-                else:
-                    console.print(f"[red]❌ User '{target_user}' not found.[/red]")
-            
-            elif parts[0] == 'setbalance':
-                if len(parts) != 3:
-                    console.print(Panel(
-                        f"❌ Incomplete command: 'setbalance' requires username and amount\n"
-                        f"💡 Usage: setbalance <username> <amount> (e.g., setbalance john 15000)",
-                        title="⚠️ Command Help", border_style="yellow"))
-                    continue
-                target_user = parts[1]
-                try:
-                    new_balance = float(parts[2])
-                    if target_user in users:
-                        old_balance = users[target_user].get('balance', 0)
-                        users[target_user]['balance'] = new_balance
-                        console.print(Panel(
-                            f"💰 Balance updated for '{target_user}'\n"
-                            f"Old Balance: ₹{old_balance:,.2f}\n"
-                            f"New Balance: ₹{new_balance:,.2f}",
-                            title="💳 Balance Update", border_style="green"))
-                    else:
-                        console.print(f"[red]❌ User '{target_user}' not found.[/red]")
-                except ValueError:
-                    console.print("[red]❌ Invalid balance amount.[/red]")
-            
-            elif parts[0] == 'backup':
-                import datetime
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_file = f"backup_users_{timestamp}.json"
-                try:
-                    with open(backup_file, 'w') as f:
-                        json.dump(users, f, indent=2)
-                    console.print(Panel(f"✅ User data backed up to: {backup_file}", 
-                                      title="💾 Backup Created", border_style="green"))
-                except Exception as e:
-                    console.print(f"[red]❌ Backup failed: {e}[/red]")
-            
-            elif parts[0] == 'stats':
-                system_stats(users, pending_orders)
-            
-            elif parts[0] == 'clearorders':
-                order_count = len(pending_orders)
-                if order_count > 0:
-                    confirm = console.input(f"[bold red]⚠️  Clear {order_count} pending orders? (yes/no): [/bold red]").strip().lower()
-                    if confirm == 'yes':
-                        pending_orders.clear()
-                        console.print(Panel(f"🧹 Cleared {order_count} pending orders.", 
-                                          title="📋 Orders Cleared", border_style="yellow"))
-                    else:
-                        console.print("[yellow]Clear cancelled.[/yellow]")
-                else:
-                    console.print("[yellow]No pending orders to clear.[/yellow]")
-            
-            elif parts[0] == 'quit':
-                console.print("[bold]💾 Saving admin session...[/bold]")
-                enhanced_loading_animation("Saving data...", 0.5)
-                break
-            
-        elif parts[0] == 'quit':
-            console.print("[bold]💾 Saving trading session...[/bold]")
-            enhanced_loading_animation("Saving data...", 0.5)
-            break
-        
-        else:
-            # Check if it's a partial match for known commands
-            known_commands = ['help', 'prices', 'details', 'graph', 'buy', 'limitbuy', 'sell', 'limitsell', 'sellpct', 'sellanalysis', 'stoploss', 'trailstop', 'orders', 'cancel', 'portfolio', 'leaderboard', 'challenge', 'refresh', 'quit']
-            if is_admin(username):
-                known_commands.extend(['listusers', 'userinfo', 'resetuser', 'deleteuser', 'setbalance', 'backup', 'stats', 'clearorders'])
-            
-            # Check for partial matches
-            partial_matches = [cmd for cmd in known_commands if cmd.startswith(parts[0])]
-            
-            if partial_matches:
-                suggestions = ', '.join(partial_matches)
-                console.print(Panel(
-                    f"❓ Did you mean: {suggestions}?\n"
-                    f"💡 Type [cyan]help[/cyan] to see all available commands.",
-                    title="🤔 Possible Command", border_style="yellow"))
-            else:
-                console.print(Panel(
-                    f"❌ Unknown command: '{parts[0]}'\n"
-                    f"💡 Type [cyan]help[/cyan] to see all available commands.",
-                    title="⚠️  Command Error", border_style="red"))
-        
-        # Show status panel after certain commands
-        if show_status:
-            console.print("\n" + "─" * 80)
-            console.print(create_status_panel(user, stocks))
-        
-        # Save data after each transaction
-        save_data(USERS_FILE, users)
-        save_data(LEADERBOARD_FILE, leaderboard) 
-        save_data(ORDERS_FILE, pending_orders)
+    try:
+        asyncio.run(run_session(ctx))
+    except EOFError:
+        pass  # stdin closed; save and say goodbye as on quit
+    except KeyboardInterrupt:
+        # The prompt thread is still blocked reading stdin, which breaks interpreter
+        # shutdown, so save queued data and exit directly
+        flush_data()
+        console.print("\n[yellow]Session interrupted.[/yellow]")
+        os._exit(130)
+    
+    # Snapshot on quit
+    compact_users(users)
+    mark_dirty(LEADERBOARD_FILE, leaderboard)
     
     console.print(Panel(
         "🎉 Thank you for using Ultimate Stock Trader!\n"
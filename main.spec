@@ -10,6 +10,9 @@ a = Analysis(
     hiddenimports=[
         'rich',
         'yfinance',
+        'pandas',
+        'numpy',
+        'orjson',
         'mplfinance',
         'matplotlib',
         'candlestick_chart',